@@ -1,47 +1,54 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import altair as alt
 import pandas as pd
-from vega_datasets import data
+import functools
+import os
 import warnings
 
+from brfss import RECENT_START, first_year, latest_year, state_year_means
+from data_loader import DISEASES, dataset_version, load_demographic
+from embed import spec_html
+from export import prebuilt_spec, variant_name
+from geo import choropleth_data, choropleth_datasets, us_states_data, us_states_datasets
+from instrumentation import TIMINGS_ENABLED, span, timed, trace
+from query import brfss_state_means, country_series, top_locations, world_trend, year_range
+from spec_cache import SpecCache, chart_to_spec, warm_up
+from store import source_precision
+
 # Ignore all warnings
 warnings.filterwarnings('ignore')
-countries = alt.topo_feature(data.world_110m.url, 'countries')
-
-# Load datasets
-values = pd.read_csv("burden-disease-from-each-mental-illness.csv")
-
-# Dataset preprocessing
-values.rename(columns={
-    'Entity': 'name',
-    'Code': 'alpha-3',
-    'DALYs from depressive disorders per 100,000 people in, both sexes aged age-standardized': 'Depression',
-    'DALYs from schizophrenia per 100,000 people in, both sexes aged age-standardized': 'Schizophrenia',
-    'DALYs from bipolar disorder per 100,000 people in, both sexes aged age-standardized': 'Bipolar Disorder',
-    'DALYs from eating disorders per 100,000 people in, both sexes aged age-standardized': 'Eating Disorders',
-    'DALYs from anxiety disorders per 100,000 people in, both sexes aged age-standardized': 'Anxiety Disorders',
-}, inplace=True)
-values_all_years = values
-quantitative_columns = ['alpha-3','Depression', 'Schizophrenia', 'Bipolar Disorder', 'Eating Disorders', 'Anxiety Disorders']
-values.dropna(subset=quantitative_columns, inplace=True)
 
 # alt.data_transformers.disable_max_rows()
-countries = alt.topo_feature(data.world_110m.url, "countries")  
-country_codes = pd.read_csv(
-    "https://raw.githubusercontent.com/lukes/ISO-3166-Countries-with-Regional-Codes/master/all/all.csv"
-)
+
+# Page layouts: world and US map widths in CSS pixels, and the device pixels
+# per CSS pixel their geometry is detailed for (see geo.GEOMETRY_TIERS).
+# Desktops are sized for high-DPI screens. Phones stack each section's charts
+# with maps as wide as the screen, and take geometry exact to a CSS pixel
+# rather than a device pixel, so they download the coarsest tier.
+LAYOUTS = {'desktop': (400, 340, 2), 'phone': (320, 320, 1)}
 
 ###### First plots ########
-def create_plot_first(subgroup, year=2019):
-    values_tmp = values[values['Year'] == year]
-    # Apply any required transformations to the data in pandas
-    background = alt.Chart(countries).mark_geoshape(
-        fill="lightgray"
-        ).transform_filter(
-            alt.datum.id != 10 # Exclude Antarctica from the map
-        )
+@timed('build_chart')
+def create_plot_first(subgroup, year=2019, slider=False, layout='desktop'):
+    # With slider=True the chart carries every year and `year` is only the initial
+    # value of a Vega slider; the map and top-10 chart filter on it in the browser.
+    first_year, last_year = year_range()
+    # Local world topology with name and value already joined onto each country (Antarctica removed).
+    # It is a named dataset: serialize with choropleth_datasets(subgroup, year, map_width * pixel_ratio).
+    map_width, _, pixel_ratio = LAYOUTS[layout]
+    countries = choropleth_data(subgroup, None if slider else year, map_width * pixel_ratio)
+    # Each country's yearly values packed into one row, for the top-10 and trend charts
+    series = country_series(subgroup)[['location', 'start', 'values']].rename(columns={'location': 'name'})
+    year_param = alt.param(
+        name="year",
+        value=year,
+        bind=alt.binding_range(min=first_year, max=last_year, step=1, name="Year "),
+    )
+    year_title = alt.ExprRef(expr="year") if slider else year
+    map_value = ("datum.properties.values ? datum.properties.values[year - datum.properties.start] : null"
+                 if slider else "datum.properties.value")
 
-    # we transform twice, first from "ISO 3166-1 numeric" to name, then from name to value
     selection = alt.selection_point(fields=["name"], empty="none")
     opacity_condition = alt.condition(selection, 
                                 alt.value(1), 
@@ -53,21 +60,21 @@ def create_plot_first(subgroup, year=2019):
                                     alt.value(1.5),
                                     alt.value(0.1))
 
-    foreground = (
+    # One layer draws every country; invalid=None keeps those without a value, filled grey
+    countries_map = (
         alt.Chart(countries)
-        .mark_geoshape()
-        .transform_lookup(
-            lookup="id",
-            from_=alt.LookupData(data=country_codes, key="country-code", fields=["alpha-3"]),
-        )
-        .transform_lookup(
-            lookup="alpha-3",
-            from_=alt.LookupData(data=values_tmp, key="alpha-3", fields=["name",f"{subgroup}"]),
+        .mark_geoshape(invalid=None)
+        .transform_calculate(
+            **{"name": "datum.properties.name", subgroup: map_value}
         )
         .encode(
-            fill=alt.Color(
-                f"{subgroup}:Q",
-                scale=alt.Scale(scheme="reds"),  # adjust the domain as needed
+            fill=alt.condition(
+                f"isValid(datum[{subgroup!r}])",
+                alt.Color(
+                    f"{subgroup}:Q",
+                    scale=alt.Scale(scheme="reds"),  # adjust the domain as needed
+                ),
+                alt.value("lightgray"),
             ),
             stroke=stroke_condition,
             strokeWidth=stroke_width_condition,
@@ -75,11 +82,11 @@ def create_plot_first(subgroup, year=2019):
             opacity=opacity_condition,
         )
     ).properties(
-        title=f"{subgroup} per 100,000 people in Year {year}"
+        title=_year_title(f"{subgroup} per 100,000 people in Year ", year_title)
     )
 
     chart = (
-        (background + foreground)
+        countries_map
         .properties(width=600, height=600)
         .project(
             type="mercator"
@@ -87,13 +94,31 @@ def create_plot_first(subgroup, year=2019):
             selection
         )
     ).properties(
-        width = 400,
+        width = map_width,
     )
+    if layout == 'phone':
+        chart = chart.properties(height = map_width)
+
+    if slider:
+        # Unpack the per-country series, keep the slider's year and rank it in the browser
+        top_countries = alt.Chart(series).transform_flatten(
+            ["values"], as_=[subgroup]
+        ).transform_window(
+            index="row_number()", groupby=["name"]
+        ).transform_filter(
+            f"datum.start + datum.index - 1 == year && isValid(datum[{subgroup!r}])"
+        ).transform_window(
+            rank="row_number()", sort=[alt.SortField(subgroup, order="descending")]
+        ).transform_filter(
+            alt.datum.rank <= 10
+        )
+    else:
+        top_countries = alt.Chart(
+            top_locations(subgroup, n=10, years=year).rename(columns={'location': 'name', 'value': subgroup})
+        )
 
     pop_bar_chart = (
-        alt.Chart(
-            values_tmp.nlargest(10, subgroup)
-        ).mark_bar().encode(
+        top_countries.mark_bar().encode(
             x=alt.X(f"{subgroup}:Q", title=f'{subgroup} per 100,000 people'),
             y=alt.Y("name:N", sort='-x'),
             color=alt.Color(f"{subgroup}:Q",scale=alt.Scale(scheme="reds"),legend=None),
@@ -102,19 +127,20 @@ def create_plot_first(subgroup, year=2019):
         ).add_selection(
             selection
         ).properties(
-            title=f"Top 10 countries by {subgroup} in Year {year}"
+            title=_year_title(f"Top 10 countries by {subgroup} in Year ", year_title)
         )
     ).properties(
         width = 200,
         height = 200
     )
 
+    # Yearly means across countries, cached per disease by the query layer
     global_trend = (
-        alt.Chart(values_all_years)
+        alt.Chart(world_trend(subgroup).rename(columns={'year': 'Year', 'value': subgroup}))
         .mark_line()
         .encode(
             x=alt.X("Year:O", title='Year'),
-            y=alt.Y(f"mean({subgroup}):Q", title=f'Average {subgroup} per 100,000 people'),
+            y=alt.Y(f"{subgroup}:Q", title=f'Average {subgroup} per 100,000 people'),
             color=alt.value('lightgrey'),  # Use a neutral color like grey for the global line
         )
         .properties(
@@ -123,7 +149,7 @@ def create_plot_first(subgroup, year=2019):
     )
 
     country_trend = (
-        alt.Chart(values_all_years)
+        alt.Chart(series)
         .mark_line()
         .encode(
             x=alt.X("Year:O", title='Year'),
@@ -134,6 +160,15 @@ def create_plot_first(subgroup, year=2019):
         .transform_filter(
             selection  # Filter based on the selected country
         )
+        .transform_flatten(
+            ["values"], as_=[subgroup]  # Unpack the selected country's yearly values
+        )
+        .transform_window(
+            index="row_number()", groupby=["name"]
+        )
+        .transform_calculate(
+            Year="datum.start + datum.index - 1"
+        )
         .properties(
             title=f"Country-Specific {subgroup} and Trend per 100,000 people"
         )
@@ -146,15 +181,28 @@ def create_plot_first(subgroup, year=2019):
         height = 150
     )
 
-    final_visualization = chart | (pop_bar_chart & line_plot)
+    if layout == 'phone':
+        final_visualization = chart & pop_bar_chart & line_plot
+    else:
+        final_visualization = chart | (pop_bar_chart & line_plot)
+    if slider:
+        final_visualization = final_visualization.add_params(year_param)
     final_visualization = final_visualization.configure_title(fontSize=16).configure_legend(offset=0,padding=0,titleFontSize=11, labelFontSize=11)
     return final_visualization
     
 
+def _year_title(prefix, year):
+    # A fixed title, or one that follows the year slider's param
+    if isinstance(year, alt.ExprRef):
+        return alt.TitleParams(alt.ExprRef(expr=f"{prefix!r} + {year.expr}"))
+    return f"{prefix}{year}"
+
+
 ##### Second Plots ########
+@timed('build_chart')
 def creat_plot_line_second(df, color_col, title):
     if color_col == 'Race/Ethnicity':
-        bar = alt.Chart(df_race).mark_bar(color='#7EA1FF').encode(
+        bar = alt.Chart(df).mark_bar(color='#7EA1FF').encode(
         alt.Y('Race/Ethnicity:N', sort='-x', title=None),
         alt.X('percentage:Q', scale=alt.Scale(domain=[0, 0.18])),
         tooltip=alt.Text('percentage:Q', format='.1%', title=None)
@@ -212,15 +260,15 @@ def creat_plot_line_second(df, color_col, title):
         return final_viz
 
 ##### Third Plot ########
-def plot_depression_recent_prevalence():
-    depression = pd.read_csv("BRFSS_Age-Adjusted_Prevalence_Data_Depression.csv")
-    depression = depression[depression["Response"] == "Yes"]
-    depression.rename(columns={"Locationdesc": "State", "Data_value": "Depression_rate"}, inplace=True)
-    
-    depression_recent = depression[depression["Year"] >= 2020]
-    depression_recent = depression_recent.groupby(["LocationID", "State"])["Depression_rate"].mean().reset_index()
-
-    states = alt.topo_feature(data.us_10m.url, 'states')
+@timed('build_chart')
+def plot_depression_recent_prevalence(layout='desktop'):
+    # Per-state aggregates maintained by `preprocess.py brfss-ingest`
+    depression = state_year_means()
+    depression_recent = brfss_state_means(years=(RECENT_START, None))
+
+    # Local US topology at the map's level of detail; serialize with us_states_datasets(map_width * pixel_ratio)
+    _, map_width, pixel_ratio = LAYOUTS[layout]
+    states = us_states_data(map_width * pixel_ratio)
     selection = alt.selection_point(
         fields=["LocationID"],
         value=[{"LocationID":54}, {"LocationID":21}, {"LocationID":26}, {"LocationID":47}],
@@ -231,7 +279,9 @@ def plot_depression_recent_prevalence():
         type='albersUsa'
     ).transform_lookup(
         lookup='id',
-        from_=alt.LookupData(depression_recent, "LocationID", list(depression.columns))
+        from_=alt.LookupData(depression_recent, "LocationID", ["State", "Depression_rate"])
+    ).transform_calculate(
+        LocationID="datum.id"  # Field the state selection is keyed on
     ).encode(
         alt.Color("Depression_rate:Q", legend=alt.Legend(
             orient="top",
@@ -243,8 +293,8 @@ def plot_depression_recent_prevalence():
     ).add_params(
         selection
     ).properties(
-        title="Prevalence of Depression (2020-2022)",
-        width=340,
+        title=f"Prevalence of Depression ({RECENT_START}-{latest_year()})",
+        width=map_width,
         height=160
     )
 
@@ -292,14 +342,201 @@ def plot_depression_recent_prevalence():
         )),
         tooltip=["State:N", "Depression_rate:Q"]
     ).properties(
-        title="Depression by State, 2011-2022",
-        width=400,
+        title=f"Depression by State, {first_year()}-{latest_year()}",
+        width=map_width if layout == 'phone' else 400,
         height=220
     )
 
+    if layout == 'phone':
+        return map & (vline + text + error_band + line)
     return map | (vline + text + error_band + line)
 
 
+##### Chart spec cache ########
+YEARS = [2019, 2018, 2017, 2016, 2015, 2014, 2013, 2012, 2011, 2010, 2009, 2008, 2007, 2006, 2005, 2004, 2003, 2002, 2001, 2000, 1999, 1998, 1997, 1996, 1995, 1994, 1993, 1992, 1991, 1990]
+DEMOGRAPHIC_TITLES = {'Gender': "Percentage of U.S. Population that had Depression from 1990 to 2019 by Gender",
+                      'Age': "Percentage of U.S. Population that had Depression from 2009 to 2017 by Age",
+                      'Income': "Percentage of U.S. Population that had Depression from 2006 to 2016 by PIR",
+                      'Race/Ethnicity': 'Percentage of U.S. Population that had Depression by Race/Ethnicity in 2021'}
+
+
+PRERENDERED_SPECS = os.environ.get("PRERENDERED_SPECS")
+
+
+@st.cache_resource(show_spinner=False)
+def get_spec_cache():
+    # One cache per process, shared by every session
+    return SpecCache(max_bytes=int(os.environ.get("SPEC_CACHE_MB", "64")) * 2**20)
+
+
+# Uncached builders; benchmark.py times these directly
+def build_first_plot_spec(subgroup, year, slider=False, layout='desktop'):
+    map_width, _, pixel_ratio = LAYOUTS[layout]
+    datasets = choropleth_datasets(subgroup, None if slider else year, map_width * pixel_ratio)
+    return chart_to_spec(create_plot_first(subgroup, year, slider=slider, layout=layout), datasets)
+
+
+def build_second_plot_spec(factor):
+    df = source_precision(load_demographic(factor))
+    return chart_to_spec(creat_plot_line_second(df, factor, DEMOGRAPHIC_TITLES[factor]))
+
+
+def build_third_plot_spec(layout='desktop'):
+    _, map_width, pixel_ratio = LAYOUTS[layout]
+    return chart_to_spec(plot_depression_recent_prevalence(layout), us_states_datasets(map_width * pixel_ratio))
+
+
+##### Chart variants ########
+# A variant is (name, chart, uncached build, play param). The spec getters,
+# the warm-up, benchmark.py and export.py all take them from here, so an
+# export covers exactly the specs the app asks for.
+def first_variant(subgroup, year, layout):
+    return (variant_name("first", layout, subgroup, year), "first",
+            functools.partial(build_first_plot_spec, subgroup, year, layout=layout), None)
+
+
+def first_slider_variant(subgroup, layout):
+    # Every year in one spec; the year slider starts at the latest year
+    return (variant_name("first", layout, subgroup, "all-years"), "first-slider",
+            functools.partial(build_first_plot_spec, subgroup, YEARS[0], slider=True, layout=layout), "year")
+
+
+def second_variant(factor):
+    return variant_name("second", factor), "second", functools.partial(build_second_plot_spec, factor), None
+
+
+def third_variant(layout):
+    return variant_name("third", layout), "third", functools.partial(build_third_plot_spec, layout), None
+
+
+def chart_variants():
+    """Every chart variant the page can show, most likely views first."""
+    variants = [third_variant(layout) for layout in LAYOUTS]
+    variants += [second_variant(factor) for factor in DEMOGRAPHIC_TITLES]
+    variants += [first_slider_variant(subgroup, layout) for layout in LAYOUTS for subgroup in DISEASES]
+    variants += [first_variant(subgroup, year, layout) for layout in LAYOUTS for year in YEARS for subgroup in DISEASES]
+    return variants
+
+
+def cached_spec(variant):
+    # With PRERENDERED_SPECS set to the output of export.py, a cache miss reads
+    # the exported spec instead of building it, if the export matches this code and data
+    name, _, build, _ = variant
+    def load():
+        spec = prebuilt_spec(PRERENDERED_SPECS, name) if PRERENDERED_SPECS else None
+        return spec if spec is not None else build()
+    return get_spec_cache().get((name, dataset_version()), load)
+
+
+def first_plot_spec(subgroup, year, layout):
+    return cached_spec(first_variant(subgroup, year, layout))
+
+
+def first_plot_slider_spec(subgroup, layout):
+    return cached_spec(first_slider_variant(subgroup, layout))
+
+
+def second_plot_spec(factor):
+    return cached_spec(second_variant(factor))
+
+
+def third_plot_spec(layout):
+    return cached_spec(third_variant(layout))
+
+
+@st.cache_resource(show_spinner=False)
+def start_spec_warm_up():
+    # Prebuild every chart variant in the background
+    return warm_up(get_spec_cache(), [functools.partial(cached_spec, variant) for variant in chart_variants()])
+
+
+def client_layout():
+    # Streamlit does not report the viewport; phone browsers put "Mobi" in their User-Agent
+    return 'phone' if 'Mobi' in st.context.headers.get('User-Agent', '') else 'desktop'
+
+
+def first_section_spec(subgroup, year, slider_mode, layout):
+    return first_plot_slider_spec(subgroup, layout) if slider_mode else first_plot_spec(subgroup, year, layout)
+
+
+def chart_placeholder():
+    placeholder = st.empty()
+    placeholder.info("Loading chart…")
+    return placeholder
+
+
+def show_spec(placeholder, spec):
+    with span("transport"):
+        placeholder.vega_lite_chart(spec, use_container_width=True)
+
+
+##### Timings ########
+# APP_TIMINGS=1 logs a JSON line per section rerun; ?debug=timings also shows
+# this session's breakdown under each chart.
+def timings_requested():
+    return st.query_params.get("debug") == "timings"
+
+
+def timed_section(section):
+    @functools.wraps(section)
+    def wrapper():
+        show_panel = timings_requested()
+        with trace(section.__name__, TIMINGS_ENABLED or show_panel) as rerun:
+            section()
+        if show_panel:
+            timings_panel(rerun)
+    return wrapper
+
+
+def timings_panel(rerun):
+    with st.expander(f"Timings: {rerun.label} took {rerun.duration * 1000:.0f} ms"):
+        stages = pd.DataFrame.from_dict(rerun.breakdown(), orient='index')
+        stages.index.name = 'stage'
+        st.dataframe(stages.round(1), use_container_width=True)
+        st.caption("parse_csv/read_store: loading source files · load_data: cached pandas tables · query: DuckDB slices · "
+                   "build_chart: filtering and Altair construction · serialize: to_dict · "
+                   "transport: handing the spec to Streamlit · self_ms excludes nested stages")
+
+
+##### Page sections ########
+# Each chart section is a fragment that owns its widgets: changing one of them
+# reruns and re-sends only that section instead of the whole page.
+@st.fragment
+@timed_section
+def first_section():
+    col1, col2 = st.columns(2)
+    with col1:
+        subgroup_choice = st.selectbox("Select the illness you would like to explore:", DISEASES, key="first_subgroup")
+        slider_mode = st.toggle("Scrub through the years", key="first_slider", help="Load every year at once and pick the year with a slider below the chart")
+
+    with col2:
+        year_choice = st.selectbox("Select the year you would like to explore:", YEARS, disabled=slider_mode, key="first_year")
+        animate = st.toggle("Animate", disabled=not slider_mode, help="Play through the years")
+
+    placeholder = chart_placeholder()
+    spec = first_section_spec(subgroup_choice, year_choice, slider_mode, client_layout())
+    if not (slider_mode and animate):
+        show_spec(placeholder, spec)
+    else:
+        # Streamlit's chart element has no hook for driving a param, so hand the
+        # spec to vega-embed in an iframe that steps the year itself
+        with span("transport"), placeholder.container():
+            components.html(spec_html(spec, title=subgroup_choice, play_param="year"), height=720, scrolling=True)
+
+
+@st.fragment
+@timed_section
+def second_section():
+    aspect_type = st.selectbox("Select a factor to break down:", list(DEMOGRAPHIC_TITLES), key="second_factor")
+    show_spec(chart_placeholder(), second_plot_spec(aspect_type))
+
+
+@st.fragment
+@timed_section
+def third_section():
+    show_spec(chart_placeholder(), third_plot_spec(client_layout()))
+
+
 if __name__ == '__main__':
     # st.markdown(
     # f"""
@@ -323,28 +560,10 @@ if __name__ == '__main__':
         layout="centered"
     )
 
-    countries = alt.topo_feature(data.world_110m.url, 'countries')
-    values = pd.read_csv("burden-disease-from-each-mental-illness.csv")
-    values.rename(columns={
-        'Entity': 'name',
-        'Code': 'alpha-3',
-        'DALYs from depressive disorders per 100,000 people in, both sexes aged age-standardized': 'Depression',
-        'DALYs from schizophrenia per 100,000 people in, both sexes aged age-standardized': 'Schizophrenia',
-        'DALYs from bipolar disorder per 100,000 people in, both sexes aged age-standardized': 'Bipolar Disorder',
-        'DALYs from eating disorders per 100,000 people in, both sexes aged age-standardized': 'Eating Disorders',
-        'DALYs from anxiety disorders per 100,000 people in, both sexes aged age-standardized': 'Anxiety Disorders',
-    }, inplace=True)
-
-    values_all_years = values
-    quantitative_columns = ['alpha-3','Depression', 'Schizophrenia', 'Bipolar Disorder', 'Eating Disorders', 'Anxiety Disorders']
-    values.dropna(subset=quantitative_columns, inplace=True)
-
     # Enable Panel extensions
     alt.data_transformers.disable_max_rows()
-    countries = alt.topo_feature(data.world_110m.url, "countries")   
-    country_codes = pd.read_csv(
-        "https://raw.githubusercontent.com/lukes/ISO-3166-Countries-with-Regional-Codes/master/all/all.csv"
-    )
+    if os.environ.get("SPEC_CACHE_WARM_UP"):
+        start_spec_warm_up()
 
 ######################################################################################################################
     # Displayed Contents
@@ -356,14 +575,7 @@ if __name__ == '__main__':
     st.markdown(
         "You might think that mental health disorders are not as common as other health problems, but they are actually quite prevalent. According to the World Health Organization (WHO), mental health disorders are the leading cause of disability worldwide. In fact, it is estimated that **one in four people will experience a mental health disorder at some point in their lives**.\n\n Interacting with the figures below, you'll delve into the evolving landscape of mental health disorders across different countries worldwide. The darker the shade of red, the higher the burden of mental health disorders in that country. Upon closer examination, you'll discover that **mental health issues transcend national boundaries and socioeconomic status, affecting individuals from all walks of life**. For instance, in 2019, nine out of the ten countries with the highest rates of depression were developing regions. However, developed countries also face their share of struggles with mental disorders, with the United States leading in schizophrenia rates and Australia grappling with a significant burden of eating disorders. Remarkably, Australia's incidence of eating disorders was three times higher than the global average and has shown a steady increase since 1990. \n\n")
 
-    col1, col2 = st.columns(2)
-    with col1:
-        subgroup_choice = st.selectbox("Select the illness you would like to explore:", ['Depression', 'Schizophrenia', 'Bipolar Disorder', 'Eating Disorders', 'Anxiety Disorders'])
-
-    with col2:
-        year_choice = st.selectbox("Select the year you would like to explore:", [2019, 2018, 2017, 2016, 2015, 2014, 2013, 2012, 2011, 2010, 2009, 2008, 2007, 2006, 2005, 2004, 2003, 2002, 2001, 2000, 1999, 1998, 1997, 1996, 1995, 1994, 1993, 1992, 1991, 1990])
-
-    st.altair_chart(create_plot_first(subgroup_choice, year_choice), use_container_width=True)
+    first_section()
 
 
     ######## Second Plot ########
@@ -374,20 +586,7 @@ if __name__ == '__main__':
 
     st.markdown("The chart below shows how major depression impacts various demographic groups, including age, race, income level, and gender. While we focus on male and female genders to ensure data consistency from 1990 to 2019, it's important to note that LGBTQ+ individuals often experience higher rates of depression, influenced by societal pressures and familial dynamics. Also, due to the proximity of some data points, the value labels may overlap. To address this issue, you can click on a specific field in the legend to isolate it on the plot. ")
 
-    df_gender = pd.read_csv('depression_by_gender.csv')
-    df_age = pd.read_csv('depression_age.csv')
-    df_income = pd.read_csv('depression_income.csv')
-    df_race = pd.read_csv('depression_race.csv')
-    df_gender['percentage'] = df_gender['percentage'].str.rstrip('%').astype(float) / 100
-    df_age['percentage'] = df_age['percentage'].str.rstrip('%').astype(float) / 100
-    df_income['percentage'] = df_income['percentage'].str.rstrip('%').astype(float) / 100
-    dict_map = {'Gender': [df_gender, "Percentage of U.S. Population that had Depression from 1990 to 2019 by Gender"],
-                 'Age': [df_age, "Percentage of U.S. Population that had Depression from 2009 to 2017 by Age"],
-                 'Income': [df_income, "Percentage of U.S. Population that had Depression from 2006 to 2016 by PIR"],
-                 'Race/Ethnicity': [df_race, 'Percentage of U.S. Population that had Depression by Race/Ethnicity in 2021']}
-    
-    aspect_type = st.selectbox("Select a factor to break down:", ['Gender', 'Age', 'Income', 'Race/Ethnicity'])
-    st.altair_chart(creat_plot_line_second(dict_map[aspect_type][0], aspect_type, dict_map[aspect_type][1]), use_container_width=True)
+    second_section()
 
     st.markdown("Understanding which groups are more vulnerable to depression allows us to prioritize support for those individuals, such as our mothers, sisters, and girlfriends. For parents, it's crucial to monitor the mental well-being of your teenage children and provide them with the care and attention they need. If you belong to one of these vulnerable groups, remember to stay positive and persevere through temporary low points in life. You got this!")
 
@@ -396,7 +595,7 @@ if __name__ == '__main__':
     st.markdown("The recent COVID-19 pandemic is another factor worth noticing in the discussion of Depression. The widespread loss of loved ones and the lingering effects of illness have taken a toll on individuals, potentially impacting their ability to function optimally in various aspects of life. Furthermore, the pandemic-induced economic downturn has added another layer of concern, raising questions about potential shifts in depression rates. The World Health Organization (WHO) has reported **a significant 25% increase in the global prevalence of anxiety and depression in the first year of the pandemic**. As we seek deeper understanding, our focus remains on analyzing depression data within the United States, hoping to glean insights into this complex issue.")
     st.markdown("The interactive graph below is based on the survey data collected through the Behavior Risk Factor Surveillance System, which is administered by the Centers for Disease Control and Prevention. It reflects prevalence estimates based on age-adjusted percentage of adults who answered “yes” when asked whether they had ever been told they have a form of depression. Following the onset of the COVID-19 pandemic, we can see a growth in the rate of adults who have ever had depression in a majority of states. For example, while **the prevalence in West Virginia and Kentucky remains high, Tennessee and Michigan have shown notable increases**. You can view data for multiple states simultaneously by pressing the “shift” key. The map on the left shows **the prevalence of depression by States after the COVID-19 pandemic (2020-2022)**")
 
-    st.altair_chart(plot_depression_recent_prevalence(), use_container_width=True)
+    third_section()
 
     ######## Potential Treatment and Conclusion############
     st.markdown('## What Can We Do to Fight Against Depression?')
@@ -0,0 +1,227 @@
+"""Offline benchmarks for the app's chart builds.
+
+Run from the repository root, e.g.
+
+    python benchmark.py run [--repeat 3] [--output PATH]
+    python benchmark.py compare OLD.json NEW.json
+
+`run` builds every chart variant the page can show straight from the local
+data, bypassing the spec cache. It records build latency percentiles,
+serialized spec size and peak traced memory per chart, plus the import and
+cold-start time of app.py in a fresh interpreter, and writes them to a JSON
+file (by default build/benchmarks/<commit>.json). `compare` diffs two such
+files and exits non-zero when a metric regressed past its tolerance.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(ROOT, "build", "benchmarks")
+PERCENTILES = [50, 90, 99]
+
+# Fresh interpreters: one that only imports the app, one that also builds the
+# default view of every section, as the first session after a deploy would.
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start)
+"""
+COLD_START_SCRIPT = """
+import time
+start = time.perf_counter()
+import altair as alt
+import app
+alt.data_transformers.disable_max_rows()
+app.build_first_plot_spec(app.DISEASES[0], app.YEARS[0])
+app.build_second_plot_spec(next(iter(app.DEMOGRAPHIC_TITLES)))
+app.build_third_plot_spec()
+print(time.perf_counter() - start)
+"""
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def percentile(values, q):
+    # Nearest-rank percentile; enough for a few hundred samples
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(values):
+    summary = {f'p{q}': percentile(values, q) for q in PERCENTILES}
+    summary.update(min=min(values), max=max(values), mean=statistics.fmean(values))
+    return summary
+
+
+def time_script(script, repeat):
+    # Seconds reported by `script` in a fresh interpreter, best of `repeat`
+    env = dict(os.environ, PYTHONWARNINGS='ignore')
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, capture_output=True,
+                                text=True, check=True)
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return {'best': min(times), 'median': statistics.median(times), 'runs': times}
+
+
+def run_benchmarks(args):
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.WARNING)  # Streamlit's "no runtime" warnings for cached functions
+    warnings.filterwarnings('ignore')
+    import altair as alt
+    import pandas as pd
+    import app
+    alt.data_transformers.disable_max_rows()
+
+    builds = [(chart, name, build) for name, chart, build, _ in app.chart_variants()]
+    if args.only:
+        builds = [b for b in builds if b[0] in args.only]
+
+    # One untimed pass fills the data caches (load_burden, topology, ...), so
+    # the timed passes measure chart construction and serialization only
+    sizes = {}
+    for chart, label, build in builds:
+        sizes[(chart, label)] = len(json.dumps(build(), separators=(',', ':')))
+
+    latencies = {}
+    for _ in range(args.repeat):
+        for chart, label, build in builds:
+            start = time.perf_counter()
+            build()
+            latencies.setdefault(chart, []).append(time.perf_counter() - start)
+
+    # Memory in its own pass: tracemalloc slows allocation-heavy code down a lot
+    peaks = {}
+    for chart, label, build in builds:
+        tracemalloc.start()
+        build()
+        peaks[chart] = max(peaks.get(chart, 0), tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    charts = {}
+    for chart, times in latencies.items():
+        chart_sizes = [size for (name, _), size in sizes.items() if name == chart]
+        charts[chart] = {
+            'variants': len(chart_sizes),
+            'builds': len(times),
+            'latency_s': summarize(times),
+            'spec_bytes': summarize(chart_sizes),
+            'peak_traced_bytes': peaks[chart],
+        }
+
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    except ImportError:
+        max_rss = None
+
+    report = {
+        'commit': git_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'altair': alt.__version__, 'pandas': pd.__version__},
+        'repeat': args.repeat,
+        'charts': charts,
+        'spec_bytes': {f'{chart}:{label}': size for (chart, label), size in sizes.items()},
+        'process_max_rss_bytes': max_rss,
+        'import_s': time_script(IMPORT_SCRIPT, args.startup_repeat),
+        'cold_start_s': time_script(COLD_START_SCRIPT, args.startup_repeat),
+    }
+
+    output = args.output or os.path.join(BENCHMARK_DIR, f"{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+
+    for chart, result in charts.items():
+        latency, size = result['latency_s'], result['spec_bytes']
+        print(f"{chart:13} p50 {latency['p50'] * 1000:7.1f} ms  p99 {latency['p99'] * 1000:7.1f} ms  "
+              f"spec {size['p50'] / 1024:7.1f} KiB  peak {result['peak_traced_bytes'] / 2**20:6.1f} MiB")
+    print(f"import {report['import_s']['best']:.2f} s  cold start {report['cold_start_s']['best']:.2f} s")
+    print(f"Wrote {output}")
+
+
+##### Comparing runs ########
+def headline_metrics(report):
+    """Flat {metric: value} of the numbers a regression check looks at."""
+    metrics = {'import_s': report['import_s']['best'], 'cold_start_s': report['cold_start_s']['best']}
+    for chart, result in report['charts'].items():
+        for q in ('p50', 'p90'):
+            metrics[f'{chart}.latency_{q}_s'] = result['latency_s'][q]
+        metrics[f'{chart}.spec_max_bytes'] = result['spec_bytes']['max']
+        metrics[f'{chart}.peak_traced_bytes'] = result['peak_traced_bytes']
+    return metrics
+
+
+def compare_reports(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    old_metrics, new_metrics = headline_metrics(old), headline_metrics(new)
+
+    regressions = []
+    print(f"{'metric':36} {old['commit'] or 'old':>14} {new['commit'] or 'new':>14}  change")
+    for metric in sorted(old_metrics.keys() & new_metrics.keys()):
+        before, after = old_metrics[metric], new_metrics[metric]
+        change = (after - before) / before if before else 0.0
+        # Sizes are deterministic; timings and memory are noisy
+        tolerance = args.size_tolerance if metric.endswith('_bytes') and 'spec' in metric else args.tolerance
+        flag = ''
+        if change > tolerance:
+            flag = '  REGRESSION'
+            regressions.append(metric)
+        print(f"{metric:36} {before:14.4g} {after:14.4g}  {change:+7.1%}{flag}")
+
+    if regressions:
+        raise SystemExit(f"{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="benchmark every chart variant and write a JSON report")
+    run.add_argument('--repeat', type=int, default=3, help="timed builds per variant")
+    run.add_argument('--startup-repeat', type=int, default=3, help="fresh interpreters per startup measurement")
+    run.add_argument('--only', nargs='+', choices=['first', 'first-slider', 'second', 'third'],
+                     help="benchmark only these charts")
+    run.add_argument('--output', help="report path (default: build/benchmarks/<commit>.json)")
+    run.set_defaults(func=run_benchmarks)
+
+    compare = commands.add_parser('compare', help="diff two reports and fail on regressions")
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--tolerance', type=float, default=0.25,
+                         help="allowed relative increase in latency and memory (default 0.25)")
+    compare.add_argument('--size-tolerance', type=float, default=0.01,
+                         help="allowed relative increase in spec size (default 0.01)")
+    compare.set_defaults(func=compare_reports)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import functools
+import hashlib
+import logging
+import os
+
+import pandas as pd
+import streamlit as st
+
+import store
+from data_loader import BRFSS_CSV, file_version
+from instrumentation import timed
+
+# Per-state, per-year sums and counts of the BRFSS "Yes" responses, written
+# by `python preprocess.py brfss-ingest`. Keeping sums and counts rather than
+# means lets a new survey year be folded in without rereading the years that
+# are already ingested, and any window of years can still be averaged exactly.
+
+AGGREGATES_TABLE = 'brfss-state-year'
+KEYS = ['LocationID', 'State', 'Year']
+METRICS = ['Depression_rate', 'Confidence_limit_Low', 'Confidence_limit_High']
+AGGREGATE_DTYPES = {'LocationID': 'int16', 'State': 'category', 'Year': 'int16',
+                    **{f'{metric}_sum': 'float64' for metric in METRICS},
+                    **{f'{metric}_count': 'int32' for metric in METRICS}}
+# First year of the COVID-19 pandemic; the map shows the mean since then
+RECENT_START = 2020
+
+logger = logging.getLogger(__name__)
+
+
+@timed('parse_csv')
+def aggregate_csv(path, skip_years=(), chunksize=100_000):
+    """Stream the BRFSS export at `path` in chunks and return its sums and counts per state and year."""
+    usecols = ['Year', 'LocationID', 'Locationdesc', 'Response', 'Data_value',
+               'Confidence_limit_Low', 'Confidence_limit_High']
+    parts = []
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+        chunk = chunk[(chunk['Response'] == 'Yes') & ~chunk['Year'].isin(skip_years)]
+        if chunk.empty:
+            continue
+        chunk = chunk.rename(columns={"Locationdesc": "State", "Data_value": "Depression_rate"})
+        grouped = chunk.groupby(KEYS)[METRICS]
+        parts.append(pd.concat([grouped.sum().add_suffix('_sum'), grouped.count().add_suffix('_count')], axis=1))
+
+    if not parts:
+        return pd.DataFrame(columns=list(AGGREGATE_DTYPES))
+    # A state-year can straddle two chunks, so combine the partial sums
+    return pd.concat(parts).groupby(level=KEYS).sum().reset_index()
+
+
+def ingest(path=BRFSS_CSV, replace=False, chunksize=100_000):
+    """Fold the years in `path` that are not ingested yet into the stored aggregates.
+
+    Returns the newly ingested years. With `replace`, the aggregates are
+    rebuilt from `path` alone.
+    """
+    existing = None if replace else store.read_table(AGGREGATES_TABLE, None)
+    years = set() if existing is None else set(store.read_source_version(AGGREGATES_TABLE)['years'])
+
+    delta = aggregate_csv(path, skip_years=sorted(years), chunksize=chunksize)
+    if delta.empty:
+        if existing is not None:
+            # Mark the aggregates as checked against `path`, so the app stops flagging it as newer
+            os.utime(store.table_path(AGGREGATES_TABLE))
+        return []
+    new_years = sorted(int(year) for year in delta['Year'].unique())
+
+    combined = delta if existing is None else pd.concat([existing.astype({'State': str}), delta])
+    store.write_table(AGGREGATES_TABLE, combined.sort_values(['Year', 'LocationID']),
+                      {'years': sorted(years.union(new_years))}, AGGREGATE_DTYPES)
+    return new_years
+
+
+##### Runtime views ########
+def aggregates_version():
+    """Changes whenever the aggregates the app serves do; part of derived-table cache keys."""
+    csv_version = file_version(BRFSS_CSV)
+    try:
+        version = file_version(store.table_path(AGGREGATES_TABLE))
+    except FileNotFoundError:
+        return ('csv', csv_version)
+    # The ingested aggregates can hold years the bundled export lacks, so they
+    # are still served, but a newer export is probably waiting to be ingested
+    if csv_version > version:
+        _warn_not_ingested(version, csv_version)
+    return ('store', version)
+
+
+@functools.lru_cache(maxsize=None)
+def _warn_not_ingested(store_version, csv_version):
+    logger.warning("%s is newer than the ingested BRFSS aggregates; run `python preprocess.py brfss-ingest` "
+                   "to fold its new years in", BRFSS_CSV)
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_aggregates(version):
+    aggregates = store.read_table(AGGREGATES_TABLE, None)
+    if aggregates is None:
+        # Nothing ingested yet: aggregate the bundled export in memory
+        aggregates = aggregate_csv(BRFSS_CSV)
+    return aggregates
+
+
+@timed('load_data')
+def load_aggregates():
+    """Sums and counts per state and year; query.brfss_state_means() averages any window of them."""
+    return _load_aggregates(aggregates_version())
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _aggregates_digest(version):
+    # Normalized first: aggregates built in memory and read from the store differ in dtypes only
+    aggregates = _load_aggregates(version).astype({'State': str}).astype(AGGREGATE_DTYPES)
+    text = aggregates.sort_values(KEYS).to_csv(index=False)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def aggregates_digest():
+    """Content digest of the aggregates the app serves, independent of how and where they were built."""
+    return _aggregates_digest(aggregates_version())
+
+
+def _means(aggregates, keys):
+    sums = aggregates.groupby(keys, observed=True).sum(numeric_only=True)
+    means = pd.DataFrame({metric: sums[f'{metric}_sum'] / sums[f'{metric}_count'] for metric in METRICS})
+    return means.round(2).reset_index()
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _state_year_means(version):
+    return _means(_load_aggregates(version), KEYS)
+
+
+@timed('load_data')
+def state_year_means():
+    """Mean depression rate and confidence limits per state and year."""
+    return _state_year_means(aggregates_version())
+
+
+def first_year():
+    return int(load_aggregates()['Year'].min())
+
+
+def latest_year():
+    return int(load_aggregates()['Year'].max())
@@ -0,0 +1,149 @@
+import os
+
+import pandas as pd
+import streamlit as st
+
+import store
+from instrumentation import timed
+
+# All datasets are loaded and normalized once per process and shared
+# read-only by every session. Each loader is keyed on the file's mtime, so
+# dropping in a new extract invalidates the cached copy on the next rerun.
+# Callers must treat the returned frames as read-only.
+#
+# Loaders read the columnar store (see build_store) when it was built from the
+# current source file, and fall back to parsing the CSV otherwise. Callers pass
+# the columns they use; from the store, metrics are float32 views of the
+# memory-mapped file (see store.source_precision before charting them).
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+# Reference data bundled with the app, refreshed with preprocess.py
+VENDOR_DIR = os.path.join(DATA_DIR, "data")
+
+BURDEN_CSV = os.path.join(DATA_DIR, "burden-disease-from-each-mental-illness.csv")
+BRFSS_CSV = os.path.join(DATA_DIR, "BRFSS_Age-Adjusted_Prevalence_Data_Depression.csv")
+DEMOGRAPHIC_CSVS = {
+    'Gender': os.path.join(DATA_DIR, "depression_by_gender.csv"),
+    'Age': os.path.join(DATA_DIR, "depression_age.csv"),
+    'Income': os.path.join(DATA_DIR, "depression_income.csv"),
+    'Race/Ethnicity': os.path.join(DATA_DIR, "depression_race.csv"),
+}
+# Columns and UN M49 region semantics of lukes/ISO-3166-Countries-with-Regional-Codes
+# (`python preprocess.py country-codes` refreshes it from there)
+COUNTRY_CODES_CSV = os.path.join(VENDOR_DIR, "iso3166-countries.csv")
+
+BURDEN_COLUMNS = {
+    'Entity': 'name',
+    'Code': 'alpha-3',
+    'DALYs from depressive disorders per 100,000 people in, both sexes aged age-standardized': 'Depression',
+    'DALYs from schizophrenia per 100,000 people in, both sexes aged age-standardized': 'Schizophrenia',
+    'DALYs from bipolar disorder per 100,000 people in, both sexes aged age-standardized': 'Bipolar Disorder',
+    'DALYs from eating disorders per 100,000 people in, both sexes aged age-standardized': 'Eating Disorders',
+    'DALYs from anxiety disorders per 100,000 people in, both sexes aged age-standardized': 'Anxiety Disorders',
+}
+DISEASES = ['Depression', 'Schizophrenia', 'Bipolar Disorder', 'Eating Disorders', 'Anxiety Disorders']
+
+# Stored columns and their types; everything else in the sources is dropped
+BURDEN_DTYPES = {'name': 'category', 'alpha-3': 'category', 'Year': 'int16',
+                 **{subgroup: 'float32' for subgroup in DISEASES}}
+DEMOGRAPHIC_DTYPES = {'Gender': {'year': 'int16', 'Gender': 'category', 'percentage': 'float32'},
+                      'Age': {'year': 'int16', 'Age': 'category', 'percentage': 'float32'},
+                      'Income': {'year': 'int16', 'Income': 'category', 'percentage': 'float32'},
+                      'Race/Ethnicity': {'Race/Ethnicity': 'category', 'percentage': 'float32'}}
+
+
+def file_version(path):
+    """Cache key component for a data file; changes whenever the file is replaced."""
+    return os.stat(path).st_mtime_ns
+
+
+##### Global burden of disease ########
+@timed('parse_csv')
+def read_burden_csv(path):
+    values = pd.read_csv(path)
+    values.rename(columns=BURDEN_COLUMNS, inplace=True)
+    values.dropna(subset=['alpha-3'] + DISEASES, inplace=True)
+    return values.reset_index(drop=True)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _load_burden(path, version, columns):
+    values = store.read_table('burden', version, columns)
+    if values is None:
+        values = read_burden_csv(path)
+        values = values[list(columns)] if columns else values
+    return values
+
+
+@timed('load_data')
+def load_burden(columns=None):
+    """The GBD extract: `name`, `alpha-3`, `Year` and a column per disease, or only `columns`."""
+    return _load_burden(BURDEN_CSV, file_version(BURDEN_CSV), tuple(columns) if columns else None)
+
+
+##### US demographic breakdowns ########
+@timed('parse_csv')
+def read_demographic_csv(path):
+    df = pd.read_csv(path)
+    if not pd.api.types.is_numeric_dtype(df['percentage']):
+        df['percentage'] = df['percentage'].str.rstrip('%').astype(float) / 100
+    return df
+
+
+def _demographic_table(factor):
+    return 'demographic-' + factor.replace('/', '-').lower()
+
+
+@st.cache_resource(show_spinner=False, max_entries=len(DEMOGRAPHIC_CSVS))
+def _load_demographic(factor, path, version):
+    df = store.read_table(_demographic_table(factor), version)
+    return df if df is not None else read_demographic_csv(path)
+
+
+@timed('load_data')
+def load_demographic(factor):
+    path = DEMOGRAPHIC_CSVS[factor]
+    return _load_demographic(factor, path, file_version(path))
+
+
+##### ISO-3166 country codes ########
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_country_ids(path, version):
+    # keep_default_na so Namibia's alpha-2 "NA" is not read as missing
+    codes = pd.read_csv(path, keep_default_na=False, dtype={'country-code': int})
+    return pd.Series(codes['country-code'].to_numpy(), index=codes['alpha-3'])
+
+
+def load_country_ids():
+    """alpha-3 -> ISO-3166 numeric code (the world TopoJSON feature id)."""
+    return _load_country_ids(COUNTRY_CODES_CSV, file_version(COUNTRY_CODES_CSV))
+
+
+def source_paths():
+    """The checked-in data files: source CSVs and vendored reference data."""
+    paths = [BURDEN_CSV, BRFSS_CSV, *DEMOGRAPHIC_CSVS.values()]
+    return paths + [os.path.join(VENDOR_DIR, name) for name in sorted(os.listdir(VENDOR_DIR))]
+
+
+def dataset_paths():
+    """Every data file the app reads: the source files and the columnar store derived from them."""
+    paths = source_paths()
+    if os.path.isdir(store.STORE_DIR):
+        paths += [os.path.join(store.STORE_DIR, name) for name in sorted(os.listdir(store.STORE_DIR))]
+    return paths
+
+
+def dataset_version():
+    """Changes whenever any data file the app reads is replaced; part of derived-artifact cache keys."""
+    return tuple(file_version(path) for path in dataset_paths())
+
+
+##### Columnar store ########
+def build_store():
+    """Convert every source CSV into the typed columnar store; returns the written paths."""
+    # BRFSS is stored as per-state aggregates instead (see brfss.ingest)
+    paths = [store.write_table('burden', read_burden_csv(BURDEN_CSV), file_version(BURDEN_CSV), BURDEN_DTYPES)]
+    for factor, path in DEMOGRAPHIC_CSVS.items():
+        paths.append(store.write_table(_demographic_table(factor), read_demographic_csv(path),
+                                       file_version(path), DEMOGRAPHIC_DTYPES[factor]))
+    return paths
@@ -0,0 +1,113 @@
+import functools
+import html
+import json
+import os
+
+import altair as alt
+
+from data_loader import VENDOR_DIR, file_version
+
+# Standalone HTML for a Vega-Lite spec, rendered by vega-embed at the versions
+# Altair generates specs for. The three bundles are inlined from data/ when
+# vendored with `python preprocess.py vega-bundles`, so pages work on hosts
+# without internet access; otherwise they load from the CDN.
+
+VEGA_BUNDLES = {'vega': alt.VEGA_VERSION, 'vega-lite': alt.VEGALITE_VERSION, 'vega-embed': alt.VEGAEMBED_VERSION}
+
+EMBED_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+{scripts}
+<style>
+  body {{ font-family: sans-serif; margin: 0; }}
+  #play {{ margin: 4px 0 8px; }}
+</style>
+</head>
+<body>
+{controls}
+<div id="vis"></div>
+<script>
+const spec = {spec};
+const play = {play};
+if (typeof vegaEmbed === "undefined") {{
+  document.getElementById("vis").textContent = "The chart could not load vega from cdn.jsdelivr.net. " +
+    "Run `python preprocess.py vega-bundles` to bundle it with the app for offline use.";
+  if (play) document.getElementById("play").disabled = true;
+}} else vegaEmbed("#vis", spec, {{actions: false}}).then(({{view}}) => {{
+  if (!play) return;
+  // Step the param through its slider range in the browser, wrapping around at the end
+  const bind = spec.params.find((p) => p.name === play.param).bind;
+  const button = document.getElementById("play");
+  let timer = null;
+  button.onclick = () => {{
+    if (timer) {{
+      clearInterval(timer);
+      timer = null;
+      button.textContent = "▶ Play";
+      return;
+    }}
+    button.textContent = "❚❚ Pause";
+    timer = setInterval(() => {{
+      const next = view.signal(play.param) + bind.step;
+      view.signal(play.param, next > bind.max ? bind.min : next).runAsync();
+    }}, play.interval);
+  }};
+}});
+</script>
+</body>
+</html>
+"""
+
+
+def bundle_url(name):
+    return f"https://cdn.jsdelivr.net/npm/{name}@{VEGA_BUNDLES[name]}"
+
+
+def bundle_path(name):
+    # The version is part of the name, so upgrading Altair never pairs its specs with stale bundles
+    return os.path.join(VENDOR_DIR, f"{name}@{VEGA_BUNDLES[name]}.min.js")
+
+
+def vendored_bundles():
+    """{name: path} of the vendored vega bundles, or None unless all three are."""
+    paths = {name: bundle_path(name) for name in VEGA_BUNDLES}
+    return paths if all(os.path.exists(path) for path in paths.values()) else None
+
+
+def _script_tags(sources):
+    if sources is not None:
+        return '\n'.join(f'<script src="{html.escape(src)}"></script>' for src in sources.values())
+    bundles = vendored_bundles()
+    if bundles is None:
+        return '\n'.join(f'<script src="{bundle_url(name)}"></script>' for name in VEGA_BUNDLES)
+    return '\n'.join(_inline_script(path, file_version(path)) for path in bundles.values())
+
+
+@functools.lru_cache(maxsize=len(VEGA_BUNDLES))
+def _inline_script(path, version):
+    with open(path, encoding='utf-8') as f:
+        # Same escape as the spec: "</script" in the bundle must not end the block
+        source = f.read().replace('</script', '<\\/script')
+    return f"<script>{source}</script>"
+
+
+def spec_html(spec, title="Chart", play_param=None, interval_ms=600, sources=None):
+    """Standalone HTML page rendering `spec`.
+
+    With `play_param`, the name of a top-level param bound to a range slider,
+    the page gets a Play button that animates the param through its range.
+    `sources` maps each bundle in VEGA_BUNDLES to a script URL; by default the
+    vendored bundles are inlined, or loaded from the CDN if not vendored.
+    """
+    play = {'param': play_param, 'interval': interval_ms} if play_param else None
+    controls = '<button id="play">▶ Play</button>' if play_param else ''
+    return EMBED_TEMPLATE.format(
+        title=html.escape(title),
+        scripts=_script_tags(sources),
+        controls=controls,
+        # Keep "</script>" inside string values from closing the script block
+        spec=json.dumps(spec, separators=(',', ':')).replace('</', '<\\/'),
+        play=json.dumps(play),
+    )
@@ -0,0 +1,180 @@
+"""Pre-render every chart variant to static, cacheable artifacts.
+
+Run from the repository root, e.g.
+
+    python export.py [--output build/site] [--no-html] [--prune]
+
+The chart inputs are finite: each disease and year of the world map (plus
+its all-years slider spec), each demographic factor, and the BRFSS view.
+Every variant is written as specs/<variant>.<hash>.json (the Vega-Lite spec
+the app would send) and html/<variant>.<hash>.html (a standalone page),
+named by content hash, so a static host or CDN can serve them as immutable.
+The pages load vega from vendor/ when the bundles are vendored (see
+`preprocess.py vega-bundles`), and from the CDN otherwise.
+manifest.json maps each variant to its files and should be served with a
+short cache lifetime.
+
+The manifest is stamped with a digest of the source data, the chart code,
+the content of the derived data the charts read (the query database's GBD
+extract and the BRFSS aggregates) and the Altair and Vega-Lite versions, so a
+fresh clone agrees with the machine that exported whether or not either built
+build/store, and a host with another Altair builds its own specs.
+Point the app at an export with PRERENDERED_SPECS=<output dir>: it then
+serves the prebuilt spec for every variant whose digest matches its own
+data and code, and builds the others as usual.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sys
+import warnings
+
+import altair as alt
+import streamlit as st
+
+import brfss
+import query
+from data_loader import dataset_version, file_version, source_paths
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SITE_DIR = os.path.join(ROOT, "build", "site")
+MANIFEST = "manifest.json"
+# Modules whose changes alter the rendered charts
+CHART_SOURCES = ['app.py', 'brfss.py', 'data_loader.py', 'embed.py', 'geo.py', 'query.py', 'spec_cache.py', 'store.py']
+HASH_LENGTH = 16
+
+
+def variant_name(*parts):
+    return '/'.join(str(part).replace(' ', '-').replace('/', '-').lower() for part in parts)
+
+
+def content_hash(payload):
+    return hashlib.sha256(payload).hexdigest()[:HASH_LENGTH]
+
+
+##### Export version ########
+def _versioned_paths():
+    return source_paths() + [os.path.join(ROOT, name) for name in CHART_SOURCES]
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _export_version(versions):
+    digest = hashlib.sha256()
+    for path in _versioned_paths():
+        digest.update(os.path.relpath(path, ROOT).encode())
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    # build/store is derived and its bytes are not reproducible; hash what it holds instead
+    digest.update(json.dumps({'gbd': query.source_digest(), 'brfss': brfss.aggregates_digest()}).encode())
+    # Specs follow the Vega-Lite schema of the Altair that built them
+    digest.update(json.dumps({'altair': alt.__version__, 'vega-lite': alt.VEGALITE_VERSION}).encode())
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def export_version():
+    """Digest of the source data, chart code, derived data contents and Altair version; identical checkouts agree."""
+    return _export_version((tuple((path, file_version(path)) for path in _versioned_paths()), dataset_version()))
+
+
+##### Serving an export ########
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_manifest(path, version):
+    with open(path) as f:
+        return json.load(f)
+
+
+def prebuilt_spec(site_dir, variant):
+    """The exported spec for `variant`, or None if `site_dir` holds no export of the current data and code."""
+    path = os.path.join(site_dir, MANIFEST)
+    try:
+        manifest = _load_manifest(path, file_version(path))
+    except FileNotFoundError:
+        return None
+    entry = manifest['variants'].get(variant)
+    if entry is None or manifest['version'] != export_version():
+        return None
+    with open(os.path.join(site_dir, entry['spec'])) as f:
+        return json.load(f)
+
+
+##### Writing an export ########
+def write_artifact(output, folder, variant, suffix, payload):
+    # Content-addressed, so an existing file already holds exactly these bytes
+    name = f"{variant.replace('/', '-')}.{content_hash(payload)}.{suffix}"
+    path = os.path.join(output, folder, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(payload)
+        os.replace(path + '.tmp', path)
+    return f"{folder}/{name}"
+
+
+def export_site(args):
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.WARNING)  # Streamlit's "no runtime" warnings for cached functions
+    warnings.filterwarnings('ignore')
+    import app
+    from benchmark import git_commit
+    from embed import spec_html, vendored_bundles
+    alt.data_transformers.disable_max_rows()
+
+    # Shared by every page rather than inlined into each
+    sources = None
+    bundles = vendored_bundles() if args.html else None
+    if bundles is not None:
+        sources = {}
+        for name, path in bundles.items():
+            with open(path, 'rb') as f:
+                sources[name] = '../' + write_artifact(args.output, 'vendor', name, 'js', f.read())
+
+    entries = {}
+    for variant, _, build, play_param in app.chart_variants():
+        spec = build()
+        payload = json.dumps(spec, separators=(',', ':')).encode()
+        entry = {'spec': write_artifact(args.output, 'specs', variant, 'json', payload), 'bytes': len(payload)}
+        if args.html:
+            page = spec_html(spec, title=variant, play_param=play_param, sources=sources).encode()
+            entry['html'] = write_artifact(args.output, 'html', variant, 'html', page)
+        entries[variant] = entry
+
+    manifest = {
+        'version': export_version(),
+        'commit': git_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'variants': entries,
+    }
+    path = os.path.join(args.output, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    # Swap the manifest in last, so readers never see it point at missing files
+    os.replace(path + '.tmp', path)
+
+    if args.prune:
+        live = {os.path.normpath(file) for entry in entries.values() for key, file in entry.items() if key != 'bytes'}
+        live.update(os.path.normpath(src[len('../'):]) for src in (sources or {}).values())
+        for folder in ('specs', 'html', 'vendor'):
+            directory = os.path.join(args.output, folder)
+            for name in os.listdir(directory) if os.path.isdir(directory) else []:
+                if os.path.normpath(f"{folder}/{name}") not in live:
+                    os.remove(os.path.join(directory, name))
+
+    total = sum(entry['bytes'] for entry in entries.values())
+    print(f"Exported {len(entries)} variants ({total / 2**20:.1f} MiB of specs), version {manifest['version']}")
+    print(f"Wrote {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=SITE_DIR, help="export directory (default: build/site)")
+    parser.add_argument('--no-html', dest='html', action='store_false', help="write only the JSON specs")
+    parser.add_argument('--prune', action='store_true', help="delete artifacts the new manifest no longer references")
+    export_site(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+import copy
+import json
+import math
+import os
+
+import altair as alt
+import streamlit as st
+
+import query
+from data_loader import DISEASES, VENDOR_DIR, file_version, load_country_ids
+from instrumentation import timed
+
+# Vendored topologies, so no map fetches geometry from a CDN: Natural Earth
+# countries and Census states (see data/MANIFEST.json), in the layout of the
+# vega-datasets world_110m and us_10m files that `python preprocess.py
+# world-geometry` / `us-geometry` refresh them from. World feature ids are
+# ISO 3166-1 numeric, US state ids are FIPS codes.
+WORLD_TOPOJSON = os.path.join(VENDOR_DIR, "world-110m.json")
+US_TOPOJSON = os.path.join(VENDOR_DIR, "us-10m.json")
+ANTARCTICA_ID = 10
+
+# `python preprocess.py geometry-tiers` writes simplified, quantized copies of
+# both topologies next to them (world-110m.small.json, ...). Each tier is
+# built for maps up to its width in device pixels; a chart ships the
+# coarsest tier that still looks exact at its rendered size. Map widths below
+# are device pixels: the CSS width times the pixel ratio the page targets.
+GEOMETRY_TIERS = {'small': 480, 'medium': 960, 'large': 1920}
+# Simplification tolerance and quantization step, in device pixels
+PIXEL_TOLERANCE = 0.5
+PIXEL_QUANTUM = 0.25
+# (source, object drawn, feature ids never drawn, degrees of longitude across
+# the map's width). albersUsa fits the ~60 degrees of the lower 48 states and
+# draws Alaska and Hawaii as shrunken insets.
+GEOMETRIES = {
+    'world': (WORLD_TOPOJSON, 'countries', {ANTARCTICA_ID}, 360),
+    'us': (US_TOPOJSON, 'states', set(), 60),
+}
+
+
+def tier_path(source, tier):
+    root, ext = os.path.splitext(source)
+    return f"{root}.{tier}{ext}"
+
+
+def geometry_tier(width):
+    """The coarsest tier exact for a map `width` device pixels wide; None for full detail."""
+    for tier, max_width in GEOMETRY_TIERS.items():
+        if width <= max_width:
+            return tier
+    return None
+
+
+def geometry_path(geometry, width=None):
+    """The vendored topology to draw `geometry` from at `width`."""
+    source = GEOMETRIES[geometry][0]
+    tier = None if width is None else geometry_tier(width)
+    if tier is not None and os.path.exists(tier_path(source, tier)):
+        return tier_path(source, tier)
+    return source
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _load_topology(path, version, feature, drop_ids):
+    with open(path) as f:
+        topology = json.load(f)
+    # Features that are never drawn (Antarctica) are dropped here rather than
+    # filtered in the browser; the tiers already leave them out
+    objects = topology['objects'][feature]
+    objects['geometries'] = [g for g in objects['geometries'] if g.get('id') not in drop_ids]
+    topology['objects'] = {feature: objects}
+    return topology
+
+
+def load_topology(geometry, width=None):
+    path = geometry_path(geometry, width)
+    _, feature, drop_ids, _ = GEOMETRIES[geometry]
+    return _load_topology(path, file_version(path), feature, frozenset(drop_ids))
+
+
+def load_world_topology(width=None):
+    return load_topology('world', width)
+
+
+##### Level-of-detail tiers ########
+def _decode_arcs(topology):
+    # Quantized topologies store delta-encoded integer positions
+    transform = topology.get('transform')
+    arcs = []
+    for arc in topology['arcs']:
+        if transform is None:
+            arcs.append([tuple(point[:2]) for point in arc])
+            continue
+        (kx, ky), (tx, ty) = transform['scale'], transform['translate']
+        x = y = 0
+        points = []
+        for dx, dy in arc:
+            x += dx
+            y += dy
+            points.append((x * kx + tx, y * ky + ty))
+        arcs.append(points)
+    return arcs
+
+
+def _distance(point, start, end):
+    (px, py), (ax, ay), (bx, by) = point, start, end
+    dx, dy = bx - ax, by - ay
+    if dx == dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def _simplify(points, tolerance, keep_one=False):
+    # Douglas-Peucker; the end points always stay, so arcs still meet their
+    # neighbours and shared borders stay shared
+    keep = {0, len(points) - 1}
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        index, farthest = max(((i, _distance(points[i], points[first], points[last])) for i in range(first + 1, last)),
+                              key=lambda item: item[1])
+        if farthest > tolerance or keep_one:
+            keep.add(index)
+            stack += [(first, index), (index, last)]
+        keep_one = False
+    return [points[i] for i in sorted(keep)]
+
+
+def _simplify_arc(points, tolerance):
+    if len(points) > 3 and points[0] == points[-1]:
+        # A closed ring: split it at the point farthest from its start and keep
+        # a point of each half, so small islands stay polygons instead of collapsing
+        split = max(range(1, len(points) - 1), key=lambda i: math.dist(points[0], points[i]))
+        return _simplify(points[:split + 1], tolerance, True)[:-1] + _simplify(points[split:], tolerance, True)
+    return _simplify(points, tolerance)
+
+
+def _quantize(arcs, cell):
+    x0 = min(x for arc in arcs for x, _ in arc)
+    y0 = min(y for arc in arcs for _, y in arc)
+    encoded = []
+    for arc in arcs:
+        previous, deltas = (0, 0), []
+        for x, y in arc:
+            point = (round((x - x0) / cell), round((y - y0) / cell))
+            if deltas and point == previous:
+                continue
+            deltas.append([point[0] - previous[0], point[1] - previous[1]])
+            previous = point
+        if len(deltas) == 1:
+            deltas.append([0, 0])  # an arc needs two positions, even when it shrank to one
+        encoded.append(deltas)
+    return encoded, {'scale': [cell, cell], 'translate': [x0, y0]}
+
+
+def _used_arcs(geometries):
+    # Arc references are nested lists of ints; ~i refers to arc i reversed
+    def visit(arcs):
+        for arc in arcs:
+            if isinstance(arc, list):
+                yield from visit(arc)
+            else:
+                yield arc if arc >= 0 else ~arc
+    return sorted({index for geometry in geometries for index in visit(geometry.get('arcs', []))})
+
+
+def _renumber(arcs, mapping):
+    return [_renumber(arc, mapping) if isinstance(arc, list) else
+            mapping[arc] if arc >= 0 else ~mapping[~arc] for arc in arcs]
+
+
+def _ring_area(arcs, ring):
+    # Twice the signed area of a ring of quantized arcs; d3 wants exterior rings
+    # clockwise, which is negative here
+    points = []
+    for index in ring:
+        x = y = 0
+        positions = []
+        for dx, dy in arcs[index if index >= 0 else ~index]:
+            x += dx
+            y += dy
+            positions.append((x, y))
+        if index < 0:
+            positions.reverse()
+        points += positions[1:] if points else positions
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]))
+
+
+def _drop_collapsed(geometries, arcs):
+    # Quantizing can flatten a small island to a line or turn its ring over, and
+    # d3 fills such a ring as the whole globe; they are under a pixel, so drop them
+    kept = []
+    for geometry in geometries:
+        if geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+            kept.append(geometry)
+            continue
+        polygons = [geometry['arcs']] if geometry['type'] == 'Polygon' else geometry['arcs']
+        polygons = [polygon for polygon in polygons if _ring_area(arcs, polygon[0]) < 0]
+        if len(polygons) == 1:
+            kept.append(dict(geometry, type='Polygon', arcs=polygons[0]))
+        elif polygons:
+            kept.append(dict(geometry, type='MultiPolygon', arcs=polygons))
+    return kept
+
+
+def simplify_topology(topology, feature, max_width, span, drop_ids=()):
+    """`feature` of `topology` simplified and quantized for maps up to `max_width` device pixels.
+
+    `span` is the distance in source units across the map's width. Features in
+    `drop_ids`, polygons too small to survive quantization, other objects and
+    the arcs only they use are left out.
+    """
+    geometries = [g for g in topology['objects'][feature]['geometries'] if g.get('id') not in drop_ids]
+    used = _used_arcs(geometries)
+    mapping = {old: new for new, old in enumerate(used)}
+    pixel = span / max_width
+    decoded = _decode_arcs(topology)
+    arcs = [_simplify_arc(decoded[index], pixel * PIXEL_TOLERANCE) for index in used]
+    arcs, transform = _quantize(arcs, pixel * PIXEL_QUANTUM)
+    geometries = [dict(g, arcs=_renumber(g['arcs'], mapping)) if 'arcs' in g else g for g in geometries]
+    geometries = _drop_collapsed(geometries, arcs)
+    used = _used_arcs(geometries)
+    mapping = {old: new for new, old in enumerate(used)}
+    arcs = [arcs[index] for index in used]
+    geometries = [dict(g, arcs=_renumber(g['arcs'], mapping)) if 'arcs' in g else g for g in geometries]
+    return {'type': 'Topology', 'transform': transform,
+            'objects': {feature: {'type': 'GeometryCollection', 'geometries': geometries}}, 'arcs': arcs}
+
+
+def build_geometry_tiers():
+    """Write every tier of every vendored topology; returns (source, tier path) pairs."""
+    paths = []
+    for source, feature, drop_ids, span in GEOMETRIES.values():
+        if not os.path.exists(source):
+            continue
+        with open(source) as f:
+            topology = json.load(f)
+        for tier, max_width in GEOMETRY_TIERS.items():
+            path = tier_path(source, tier)
+            with open(path, 'w') as f:
+                json.dump(simplify_topology(topology, feature, max_width, span, drop_ids), f, separators=(',', ':'))
+            paths.append((source, path))
+    return paths
+
+
+##### Metrics joined onto the world topology ########
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _joined_properties(query_version):
+    # Join every (disease, year) onto the topojson ids in one pass, so a view
+    # only has to stamp its slice onto the geometry.
+    ids = load_country_ids()
+    joined = {}
+    for subgroup in DISEASES:
+        values = query.burden_rows(subgroup)
+        values = values.assign(id=values['alpha3'].map(ids)).dropna(subset=['id'])
+        for year, frame in values.groupby('year'):
+            joined[(subgroup, int(year))] = {
+                int(row.id): {'name': row.location, 'value': round(float(row.value), 2)}
+                for row in frame.itertuples(index=False)
+            }
+    return joined
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _joined_series(query_version):
+    # Every year of one disease per feature, for charts that pick the year in the browser
+    ids = load_country_ids()
+    joined = {}
+    for subgroup in DISEASES:
+        series = query.country_series(subgroup)
+        series = series.assign(id=series['alpha3'].map(ids)).dropna(subset=['id'])
+        joined[subgroup] = {
+            int(row.id): {'name': row.location, 'start': int(row.start), 'values': row.values}
+            for row in series.itertuples(index=False)
+        }
+    return joined
+
+
+def _choropleth_topology(subgroup, year, width, query_version):
+    topology = load_world_topology(width)
+    if year is None:
+        properties = _joined_series(query_version)[subgroup]
+    else:
+        properties = _joined_properties(query_version).get((subgroup, year), {})
+
+    # Share the (large) arcs with the base topology and copy only the geometry stubs
+    joined = dict(topology)
+    countries = copy.copy(topology['objects']['countries'])
+    countries['geometries'] = [
+        dict(g, properties=properties.get(g.get('id'), {})) for g in countries['geometries']
+    ]
+    joined['objects'] = {'countries': countries}
+    return joined
+
+
+def choropleth_topology(subgroup, year=None, width=None):
+    """World topojson with (subgroup, year) joined onto each feature's properties.
+
+    Properties are `name` and `value` for a single year. With `year=None` they
+    are `name`, first year `start` and the yearly `values` for every year.
+    The geometry is the tier for a map `width` device pixels wide (full detail if None).
+    """
+    return _choropleth_topology(subgroup, year, width, query.version())
+
+
+def choropleth_name(subgroup, year=None, width=None):
+    tier = None if width is None else geometry_tier(width)
+    return f"world-{tier or 'full'}-{subgroup}-{'all-years' if year is None else year}".replace(" ", "-").lower()
+
+
+def choropleth_data(subgroup, year=None, width=None):
+    # A named reference rather than inline values: Altair would otherwise
+    # deep-copy and validate ~75k nested arcs on every build. Attach the
+    # payload from choropleth_datasets() when serializing the spec.
+    return alt.NamedData(
+        name=choropleth_name(subgroup, year, width),
+        format=alt.DataFormat(type='topojson', feature='countries'),
+    )
+
+
+@timed('join_geometry')
+def choropleth_datasets(subgroup, year=None, width=None):
+    return {choropleth_name(subgroup, year, width): choropleth_topology(subgroup, year, width)}
+
+
+##### US states ########
+def us_states_name(width=None):
+    tier = None if width is None else geometry_tier(width)
+    return f"us-states-{tier or 'full'}"
+
+
+def us_states_data(width=None):
+    """The US states feature at `width`, as a named dataset to attach with us_states_datasets()."""
+    return alt.NamedData(name=us_states_name(width), format=alt.DataFormat(type='topojson', feature='states'))
+
+
+def us_states_datasets(width=None):
+    return {us_states_name(width): load_topology('us', width)}
@@ -0,0 +1,173 @@
+import collections
+import contextlib
+import contextvars
+import datetime
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# Timing spans for the rerun hot path. Tracing is off unless APP_TIMINGS is
+# set (every rerun is logged) or a session opens the page with
+# ?debug=timings (only that session's reruns are traced and shown in a
+# panel). Off, a span costs one ContextVar lookup.
+#
+# APP_PROFILE_SLOW_MS additionally samples the stack of every traced rerun and
+# writes the samples to build/profiles/ when a rerun takes longer than that.
+
+logger = logging.getLogger(__name__)
+
+TIMINGS_ENABLED = bool(os.environ.get("APP_TIMINGS"))
+PROFILE_SLOW_MS = float(os.environ.get("APP_PROFILE_SLOW_MS", "0"))
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "profiles")
+PROFILE_INTERVAL_S = 0.005
+
+if TIMINGS_ENABLED and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+_trace = contextvars.ContextVar("trace", default=None)
+_parent = contextvars.ContextVar("parent", default=None)
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Trace:
+    """Spans recorded during one rerun of a section (or one background build)."""
+
+    def __init__(self, label):
+        self.label = label
+        self.spans = []
+        self.started = time.perf_counter()
+        self.duration = None
+        self._lock = threading.Lock()
+
+    def add(self, name, parent, start, duration):
+        with self._lock:
+            self.spans.append({'name': name, 'parent': parent, 'start': start - self.started,
+                               'duration': duration, 'thread': threading.current_thread().name})
+
+    def breakdown(self):
+        """Per span name: number of calls, total time, and time not spent in child spans."""
+        stages = collections.OrderedDict()
+        for span in self.spans:
+            stage = stages.setdefault(span['name'], {'calls': 0, 'total_ms': 0.0, 'self_ms': 0.0})
+            stage['calls'] += 1
+            stage['total_ms'] += span['duration'] * 1000
+            stage['self_ms'] += span['duration'] * 1000
+        for span in self.spans:
+            if span['parent'] in stages:
+                stages[span['parent']]['self_ms'] -= span['duration'] * 1000
+        return stages
+
+    def as_record(self):
+        return {'trace': self.label, 'duration_ms': round(self.duration * 1000, 2),
+                'stages': {name: {k: round(v, 2) for k, v in stage.items()} for name, stage in self.breakdown().items()}}
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'start', 'token')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.token = _parent.set(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        _parent.reset(self.token)
+        self.trace.add(self.name, _parent.get(), self.start, duration)
+
+
+def span(name):
+    """Context manager timing a stage of the current trace; a no-op outside one."""
+    trace = _trace.get()
+    if trace is None or _parent.get() == name:
+        return _NULL_SPAN
+    return _Span(trace, name)
+
+
+def timed(name):
+    """Decorator wrapping every call of the function in span(`name`)."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = _trace.get()
+            # Nested calls of the same stage count once
+            if trace is None or _parent.get() == name:
+                return function(*args, **kwargs)
+            with _Span(trace, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+##### Traces ########
+class _StackSampler(threading.Thread):
+    # Polls the traced thread's stack, so the rerun itself is not slowed down
+    # by per-call hooks the way cProfile would slow it.
+    def __init__(self, thread_id):
+        super().__init__(name="rerun-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.samples = collections.Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(PROFILE_INTERVAL_S):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write(self, label):
+        # Folded stacks: one "frame;frame;frame count" line each, as read by
+        # flamegraph.pl, speedscope and friends
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        path = os.path.join(PROFILE_DIR, f"{label}-{stamp}.folded")
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+@contextlib.contextmanager
+def trace(label, enabled=None):
+    """Collect the spans of the enclosed code into a Trace and log it as one JSON line.
+
+    Yields the Trace, or None when tracing is disabled.
+    """
+    if not (TIMINGS_ENABLED if enabled is None else enabled):
+        yield None
+        return
+
+    current = Trace(label)
+    token = _trace.set(current)
+    sampler = None
+    if PROFILE_SLOW_MS:
+        sampler = _StackSampler(threading.get_ident())
+        sampler.start()
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - current.started
+        _trace.reset(token)
+        record = current.as_record()
+        if sampler is not None:
+            sampler.stopped.set()
+            sampler.join()
+            if current.duration * 1000 >= PROFILE_SLOW_MS:
+                record['profile'] = sampler.write(label)
+        logger.info(json.dumps(record))
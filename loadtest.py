@@ -0,0 +1,304 @@
+"""Concurrent-session load test for the app.
+
+Run from the repository root, e.g.
+
+    python loadtest.py --sessions 8 --steps 20 [--cold] [--output PATH]
+
+Starts `streamlit run app.py` headless on a free local port, then opens one
+websocket per simulated reader and speaks the same protocol as the browser:
+each session loads the page and goes through a random but reproducible
+sequence of widget changes (disease, year, year-slider mode, demographic
+factor). A change to a widget inside a fragment reruns only that fragment,
+as it would in the browser.
+
+The report covers throughput, the rerun latency distribution (overall and
+per interaction), bytes received per rerun and the server's resident
+memory. Unless --cold is given, one untimed page load fills the shared
+caches first, so the server's RSS growth divided by the number of sessions
+is the marginal memory cost of a reader. It goes to a JSON file (by default
+build/loadtests/<commit>-<sessions>.json).
+
+Needs the `websockets` package, which recent Streamlit releases already
+depend on.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from benchmark import ROOT, git_commit, summarize
+
+LOADTEST_DIR = os.path.join(ROOT, "build", "loadtests")
+APP = os.path.join(ROOT, "app.py")
+
+# Relative frequency of each interaction; readers mostly step through years
+ACTIONS = {'year': 6, 'disease': 2, 'factor': 2, 'scrub': 1}
+
+
+def rss_bytes(pid):
+    """Resident set size of process `pid`, or None without procfs."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+##### Streamlit server ########
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, timeout):
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP, '--server.headless', 'true',
+         '--server.address', '127.0.0.1', '--server.port', str(port),
+         '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"streamlit exited with status {server.returncode}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f"streamlit did not come up on port {port} within {timeout:.0f} s")
+
+
+##### Simulated readers ########
+class Session:
+    """One websocket session that tracks the page's widgets and requests reruns like the frontend."""
+
+    def __init__(self, websocket, timeout):
+        self.websocket = websocket
+        self.timeout = timeout
+        self.widgets = {}  # widget key -> (selectbox or checkbox proto, fragment id)
+        self.states = {}   # widget id -> WidgetState sent with every rerun
+        self.page_script_hash = ""
+
+    async def rerun(self, fragment_id=""):
+        """Request a rerun and read messages until it finishes; returns (bytes received, exception messages)."""
+        message = BackMsg()
+        message.rerun_script.page_script_hash = self.page_script_hash
+        message.rerun_script.fragment_id = fragment_id
+        message.rerun_script.widget_states.widgets.extend(self.states.values())
+        await self.websocket.send(message.SerializeToString())
+
+        received, errors = 0, []
+        while True:
+            raw = await asyncio.wait_for(self.websocket.recv(), self.timeout)
+            received += len(raw)
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':
+                self.page_script_hash = forward.new_session.page_script_hash
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                if element.WhichOneof('type') == 'exception':
+                    errors.append(element.exception.message)
+                elif element.WhichOneof('type') in ('selectbox', 'checkbox'):
+                    widget = getattr(element, element.WhichOneof('type'))
+                    # Ids of widgets created with a key end in "-<key>"
+                    self.widgets[widget.id.rsplit('-', 1)[-1]] = (widget, forward.delta.fragment_id)
+            elif kind == 'script_finished' and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return received, errors
+
+    def value(self, key):
+        widget, _ = self.widgets[key]
+        state = self.states.get(widget.id)
+        if hasattr(widget, 'options'):
+            return state.string_value if state else widget.options[widget.default]
+        return state.bool_value if state else widget.default
+
+    def disabled(self, key):
+        return self.widgets[key][0].disabled
+
+    async def set_value(self, key, value):
+        widget, fragment_id = self.widgets[key]
+        state = WidgetState(id=widget.id)
+        if isinstance(value, bool):
+            state.bool_value = value
+        else:
+            state.string_value = value
+        self.states[widget.id] = state
+        return await self.rerun(fragment_id)
+
+    async def interact(self, action, rng):
+        """Apply one widget change and rerun; returns (bytes received, exception messages)."""
+        if action == 'year' and not self.disabled('first_year'):
+            key = 'first_year'
+        elif action == 'disease':
+            key = 'first_subgroup'
+        elif action == 'factor':
+            key = 'second_factor'
+        else:
+            # 'scrub', or a year change while the slider has the year selectbox disabled
+            return await self.set_value('first_slider', not self.value('first_slider'))
+        widget, _ = self.widgets[key]
+        current = self.value(key)
+        return await self.set_value(key, rng.choice([o for o in widget.options if o != current]))
+
+
+async def load_page(url, timeout):
+    websocket = await websockets.connect(url, subprotocols=['streamlit'], max_size=None)
+    session = Session(websocket, timeout)
+    start = time.perf_counter()
+    received, errors = await session.rerun()
+    return session, (time.perf_counter() - start, received, errors)
+
+
+async def run_session(index, url, args):
+    rng = random.Random(args.seed * 1000 + index)
+    session, (latency, received, errors) = await load_page(url, args.timeout)
+    samples = [{'action': 'load', 'latency': latency, 'bytes': received}]
+    for _ in range(args.steps):
+        if args.think_ms:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+        action = rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        start = time.perf_counter()
+        received, step_errors = await session.interact(action, rng)
+        samples.append({'action': action, 'latency': time.perf_counter() - start, 'bytes': received})
+        errors += step_errors
+    return session, samples, errors
+
+
+async def sample_peak_rss(pid, peak):
+    while True:
+        peak[0] = max(peak[0], rss_bytes(pid) or 0)
+        await asyncio.sleep(0.1)
+
+
+async def drive(url, pid, args):
+    if not args.cold:
+        # Fill the shared caches so they don't count towards per-session memory
+        session, _ = await load_page(url, args.timeout)
+        await session.websocket.close()
+        await asyncio.sleep(1)
+    rss_baseline = rss_bytes(pid)
+
+    peak = [0]
+    sampler = asyncio.create_task(sample_peak_rss(pid, peak))
+    started = time.perf_counter()
+    sessions = []
+    for index in range(args.sessions):
+        sessions.append(asyncio.create_task(run_session(index, url, args)))
+        if args.ramp_ms:
+            await asyncio.sleep(args.ramp_ms / 1000)
+    results = await asyncio.gather(*sessions, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    # Measured while every session is still connected and holding its state
+    rss_end = rss_bytes(pid)
+    sampler.cancel()
+
+    for result in results:
+        if not isinstance(result, BaseException):
+            await result[0].websocket.close()
+    return results, elapsed, {'baseline': rss_baseline, 'end': rss_end, 'peak': peak[0] or None}
+
+
+def run_load_test(args):
+    server = None
+    if args.url:
+        url, pid = args.url, args.pid
+    else:
+        port = free_port()
+        server = start_server(port, args.timeout)
+        url, pid = f'ws://127.0.0.1:{port}/_stcore/stream', server.pid
+    try:
+        results, elapsed, rss = asyncio.run(drive(url, pid, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    completed = [result for result in results if not isinstance(result, BaseException)]
+    failures = [repr(result) for result in results if isinstance(result, BaseException)]
+    samples = [sample for _, session_samples, _ in completed for sample in session_samples]
+    errors = [error for _, _, session_errors in completed for error in session_errors] + failures
+    by_action = {}
+    for sample in samples:
+        by_action.setdefault(sample['action'], []).append(sample['latency'])
+    if rss['baseline'] is not None and rss['end'] is not None:
+        rss['per_session'] = (rss['end'] - rss['baseline']) / max(1, len(completed))
+
+    report = {
+        'commit': git_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'sessions': args.sessions,
+        'steps': args.steps,
+        'cold': args.cold,
+        'think_ms': args.think_ms,
+        'seed': args.seed,
+        'completed_sessions': len(completed),
+        'reruns': len(samples),
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'throughput_reruns_per_s': len(samples) / elapsed,
+        'rerun_latency_s': summarize([sample['latency'] for sample in samples]) if samples else None,
+        'rerun_latency_by_action_s': {action: summarize(latencies) for action, latencies in by_action.items()},
+        'rerun_bytes': summarize([sample['bytes'] for sample in samples]) if samples else None,
+        'server_rss_bytes': rss,
+    }
+
+    output = args.output or os.path.join(LOADTEST_DIR, f"{report['commit'] or 'unknown'}-{args.sessions}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+
+    print(f"{len(completed)}/{args.sessions} sessions, {len(samples)} reruns in {elapsed:.1f} s "
+          f"({report['throughput_reruns_per_s']:.1f} reruns/s), {len(errors)} errors")
+    if samples:
+        latency = report['rerun_latency_s']
+        print(f"rerun latency p50 {latency['p50'] * 1000:.0f} ms  p90 {latency['p90'] * 1000:.0f} ms  "
+              f"p99 {latency['p99'] * 1000:.0f} ms  max {latency['max'] * 1000:.0f} ms")
+        for action, summary in report['rerun_latency_by_action_s'].items():
+            print(f"  {action:8} p50 {summary['p50'] * 1000:6.0f} ms  p90 {summary['p90'] * 1000:6.0f} ms")
+    if 'per_session' in rss:
+        print(f"server RSS {rss['baseline'] / 2**20:.0f} MiB -> {rss['end'] / 2**20:.0f} MiB "
+              f"(peak {rss['peak'] / 2**20:.0f} MiB), {rss['per_session'] / 2**20:.1f} MiB per session")
+    print(f"Wrote {output}")
+    if errors:
+        raise SystemExit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8, help="concurrent sessions")
+    parser.add_argument('--steps', type=int, default=20, help="widget changes per session after the page load")
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between a session's interactions")
+    parser.add_argument('--ramp-ms', type=float, default=0, help="delay between starting sessions")
+    parser.add_argument('--cold', action='store_true',
+                        help="skip the untimed warm-up load; per-session RSS then includes the shared caches")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the interaction sequences")
+    parser.add_argument('--timeout', type=float, default=300, help="seconds allowed for server start-up and each rerun")
+    parser.add_argument('--url', help="websocket of an already running app, e.g. ws://host:8501/_stcore/stream")
+    parser.add_argument('--pid', type=int, help="with --url: server process id to read RSS from")
+    parser.add_argument('--output', help="report path (default: build/loadtests/<commit>-<sessions>.json)")
+    run_load_test(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
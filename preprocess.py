@@ -0,0 +1,197 @@
+"""Offline build steps for the app's bundled data.
+
+Run from the repository root, e.g.
+
+    python preprocess.py country-codes
+    python preprocess.py world-geometry
+    python preprocess.py us-geometry
+    python preprocess.py geometry-tiers
+    python preprocess.py vega-bundles
+    python preprocess.py store
+    python preprocess.py brfss-ingest [PATH]
+    python preprocess.py ihme-locations FILE
+    python preprocess.py query-db [PATH]
+
+Every vendored file under data/ is recorded in data/MANIFEST.json with its
+source, retrieval date and checksum, so a refresh shows up as a reviewable diff.
+"""
+import argparse
+import datetime
+import hashlib
+import io
+import json
+import os
+import urllib.request
+
+import pandas as pd
+from vega_datasets import data
+
+import brfss
+import query
+from embed import VEGA_BUNDLES, bundle_path, bundle_url
+from data_loader import BRFSS_CSV, BURDEN_CSV, COUNTRY_CODES_CSV, VENDOR_DIR, build_store
+from geo import GEOMETRY_TIERS, US_TOPOJSON, WORLD_TOPOJSON, build_geometry_tiers
+
+MANIFEST_JSON = os.path.join(VENDOR_DIR, "MANIFEST.json")
+
+COUNTRY_CODES_URL = "https://raw.githubusercontent.com/lukes/ISO-3166-Countries-with-Regional-Codes/master/all/all.csv"
+COUNTRY_CODES_COLUMNS = ['name', 'alpha-2', 'alpha-3', 'country-code', 'region', 'sub-region']
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return response.read()
+
+
+def record_vendored(path, source):
+    manifest = {}
+    if os.path.exists(MANIFEST_JSON):
+        with open(MANIFEST_JSON) as f:
+            manifest = json.load(f)
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    manifest[os.path.relpath(path, VENDOR_DIR)] = {
+        'source': source,
+        'retrieved': datetime.date.today().isoformat(),
+        'sha256': digest,
+    }
+    with open(MANIFEST_JSON, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+##### ISO-3166 country codes ########
+def refresh_country_codes(args):
+    # keep_default_na so Namibia's alpha-2 "NA" survives the round trip
+    codes = pd.read_csv(io.BytesIO(fetch(args.url)), dtype=str, keep_default_na=False)
+    codes = codes[COUNTRY_CODES_COLUMNS].sort_values('country-code')
+    codes.to_csv(COUNTRY_CODES_CSV, index=False)
+    record_vendored(COUNTRY_CODES_CSV, args.url)
+    print(f"Wrote {len(codes)} countries to {COUNTRY_CODES_CSV}")
+
+
+##### Map geometry ########
+def refresh_geometry(url, path, feature):
+    topology = json.loads(fetch(url))
+    if feature not in topology.get('objects', {}):
+        raise SystemExit(f"{url} has no '{feature}' object")
+    with open(path, 'w') as f:
+        json.dump(topology, f, separators=(',', ':'))
+    record_vendored(path, url)
+    print(f"Wrote {len(topology['objects'][feature]['geometries'])} {feature} to {path}")
+
+
+def refresh_world_geometry(args):
+    refresh_geometry(args.url, WORLD_TOPOJSON, 'countries')
+
+
+def refresh_us_geometry(args):
+    refresh_geometry(args.url, US_TOPOJSON, 'states')
+
+
+def write_geometry_tiers(args):
+    for source, path in build_geometry_tiers():
+        record_vendored(path, f"{os.path.basename(source)} simplified and quantized by `preprocess.py geometry-tiers`")
+        print(f"Wrote {path} ({os.path.getsize(path):,} bytes)")
+
+
+##### Vega bundles ########
+def refresh_vega_bundles(args):
+    for name in VEGA_BUNDLES:
+        url, path = bundle_url(name), bundle_path(name)
+        with open(path, 'wb') as f:
+            f.write(fetch(url))
+        record_vendored(path, url)
+        print(f"Wrote {path} ({os.path.getsize(path):,} bytes)")
+
+
+##### Columnar store ########
+def write_store(args):
+    for path in build_store():
+        print(f"Wrote {path} ({os.path.getsize(path):,} bytes)")
+
+
+##### BRFSS state aggregates ########
+def ingest_brfss(args):
+    years = brfss.ingest(args.path, replace=args.replace, chunksize=args.chunksize)
+    if years:
+        print(f"Ingested {', '.join(map(str, years))} from {args.path}")
+    else:
+        print(f"No new years in {args.path}")
+
+
+##### Query database ########
+def vendor_ihme_locations(args):
+    # IHME location metadata (e.g. the GBD codebook's location sheet saved as
+    # CSV): ihme_loc_id is the alpha-3 code for countries and "USA_523"-style
+    # for subnational units
+    locations = pd.read_csv(args.path, dtype=str, keep_default_na=False)
+    locations.columns = [column.strip().lower().replace(' ', '_') for column in locations.columns]
+    code = next((column for column in ('ihme_loc_id', 'iso3') if column in locations), None)
+    if 'location_id' not in locations or code is None:
+        raise SystemExit(f"{args.path} needs location_id and ihme_loc_id (or iso3) columns")
+    countries = locations[locations[code].str.fullmatch('[A-Z]{3}')]
+    countries = countries.rename(columns={code: 'alpha-3'})[['location_id', 'location_name', 'alpha-3']]
+    countries = countries.astype({'location_id': int}).drop_duplicates('location_id').sort_values('location_id')
+    countries.to_csv(query.IHME_LOCATIONS_CSV, index=False)
+    record_vendored(query.IHME_LOCATIONS_CSV, f"{os.path.basename(args.path)} (IHME location metadata)")
+    print(f"Wrote {len(countries)} countries to {query.IHME_LOCATIONS_CSV}")
+
+
+def write_query_db(args):
+    try:
+        path = query.build_query_db(args.path)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    print(f"Wrote {path} ({os.path.getsize(path):,} bytes) from {args.path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    country_codes = commands.add_parser('country-codes', help="refresh the vendored ISO-3166 lookup table")
+    country_codes.add_argument('--url', default=COUNTRY_CODES_URL)
+    country_codes.set_defaults(func=refresh_country_codes)
+
+    world_geometry = commands.add_parser('world-geometry', help="refresh the vendored world_110m topojson")
+    world_geometry.add_argument('--url', default=data.world_110m.url)
+    world_geometry.set_defaults(func=refresh_world_geometry)
+
+    us_geometry = commands.add_parser('us-geometry', help="refresh the vendored us_10m topojson")
+    us_geometry.add_argument('--url', default=data.us_10m.url)
+    us_geometry.set_defaults(func=refresh_us_geometry)
+
+    geometry_tiers = commands.add_parser(
+        'geometry-tiers', help=f"write the {'/'.join(GEOMETRY_TIERS)} detail tiers of the vendored map geometry")
+    geometry_tiers.set_defaults(func=write_geometry_tiers)
+
+    vega_bundles = commands.add_parser('vega-bundles', help="vendor the vega, vega-lite and vega-embed bundles "
+                                                            "the standalone chart pages inline")
+    vega_bundles.set_defaults(func=refresh_vega_bundles)
+
+    store = commands.add_parser('store', help="convert the source CSVs into the columnar store under build/store")
+    store.set_defaults(func=write_store)
+
+    ingest = commands.add_parser('brfss-ingest', help="fold new BRFSS years into the per-state aggregates")
+    ingest.add_argument('path', nargs='?', default=BRFSS_CSV, help="BRFSS export (default: the bundled CSV)")
+    ingest.add_argument('--replace', action='store_true', help="rebuild the aggregates from PATH alone")
+    ingest.add_argument('--chunksize', type=int, default=100_000, help="rows read per chunk")
+    ingest.set_defaults(func=ingest_brfss)
+
+    ihme_locations = commands.add_parser('ihme-locations', help="vendor the IHME location_id -> alpha-3 table "
+                                                                "used to ingest IHME exports")
+    ihme_locations.add_argument('path', help="IHME location metadata as CSV, with location_id and ihme_loc_id")
+    ihme_locations.set_defaults(func=vendor_ihme_locations)
+
+    query_db = commands.add_parser('query-db', help="build the DuckDB query database under build/store")
+    query_db.add_argument('path', nargs='?', default=BURDEN_CSV,
+                          help="GBD extract: the bundled OWID CSV (default) or an IHME GBD Results export")
+    query_db.set_defaults(func=write_query_db)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+import functools
+import hashlib
+import json
+import logging
+import numbers
+import os
+
+import duckdb
+import pandas as pd
+import streamlit as st
+
+import brfss
+import store
+from data_loader import (BURDEN_COLUMNS, BURDEN_CSV, COUNTRY_CODES_CSV, DISEASES, VENDOR_DIR, file_version,
+                         load_burden, read_burden_csv)
+from instrumentation import timed
+
+# Embedded DuckDB over the burden-of-disease data, so charts can ask for any
+# slice (cause, year or year range, region, sex, age group, top-N) without
+# scanning a DataFrame by hand.
+#
+# `python preprocess.py query-db [PATH]` writes build/store/gbd.duckdb from
+# an Our World in Data extract like the bundled one, or from the DALY rates in
+# a long-format IHME GBD Results export. The
+# burden table is stored sorted by cause and year, so DuckDB's per-row-group
+# min/max zone maps skip everything outside a queried cause and year range,
+# and an ART index on alpha3 serves single-country lookups. Without a current
+# database file the bundled extract is loaded into an in-memory database.
+
+logger = logging.getLogger(__name__)
+
+QUERY_DB = os.path.join(store.STORE_DIR, "gbd.duckdb")
+# Rows per row group; smaller groups make the zone maps finer grained
+ROW_GROUP_SIZE = 16_384
+# The bundled OWID extract holds age-standardized rates for both sexes
+BUNDLED_SEX = 'Both'
+BUNDLED_AGE = 'Age-standardized'
+# IHME GBD Results export columns, and cause names -> ours. Exports must
+# include IDs ("Show IDs" in the results tool) so countries can be matched.
+IHME_COLUMNS = ['location_id', 'location_name', 'measure_name', 'metric_name', 'cause_name', 'sex_name', 'age_name',
+                'year', 'val']
+IHME_CAUSES = {'Depressive disorders': 'Depression', 'Schizophrenia': 'Schizophrenia',
+               'Bipolar disorder': 'Bipolar Disorder', 'Eating disorders': 'Eating Disorders',
+               'Anxiety disorders': 'Anxiety Disorders'}
+# An export mixes measures (DALYs, deaths, prevalence, ...) and metrics
+# (Number, Percent, Rate); the charts show DALYs per 100,000 like the bundled extract
+IHME_MEASURE = 'DALYs (Disability-Adjusted Life Years)'
+IHME_METRIC = 'Rate'
+# IHME location_id -> alpha-3 of every country, vendored from IHME's location
+# metadata with `python preprocess.py ihme-locations FILE`
+IHME_LOCATIONS_CSV = os.path.join(VENDOR_DIR, "ihme-locations.csv")
+
+
+##### Building the database ########
+def _create_countries(con):
+    con.execute("""
+        CREATE TABLE countries AS
+        SELECT "alpha-3" AS alpha3, name, region, "sub-region" AS sub_region
+        FROM read_csv(?, all_varchar = true)
+    """, [COUNTRY_CODES_CSV])
+
+
+def _create_burden_from_owid(con, path):
+    # Wide (one column per disease) -> one row per location, year and cause
+    extract = load_burden() if os.path.abspath(path) == os.path.abspath(BURDEN_CSV) else read_burden_csv(path)
+    wide = store.source_precision(extract).rename(columns={'name': 'location', 'alpha-3': 'alpha3', 'Year': 'year'})
+    long = wide.melt(id_vars=['location', 'alpha3', 'year'], value_vars=DISEASES, var_name='cause')
+    long['location'] = long['location'].astype(str)
+    long['alpha3'] = long['alpha3'].astype(str)
+    con.register('bundled_burden', long)
+    con.execute(f"""
+        CREATE TABLE burden AS
+        SELECT location, alpha3, year::SMALLINT AS year, cause, '{BUNDLED_SEX}' AS sex, '{BUNDLED_AGE}' AS age,
+               value::DOUBLE AS value
+        FROM bundled_burden
+        ORDER BY cause, year, location
+    """)
+    con.unregister('bundled_burden')
+
+
+def _create_burden_from_ihme(con, path):
+    # Streams the CSV through DuckDB, so multi-million-row exports never go through pandas.
+    # IHME names countries differently from ISO 3166 ("Republic of Korea"), so
+    # they are matched on location_id; regions, subnational units and the
+    # global aggregate have no alpha-3 and are left out, as in the bundled extract.
+    if not os.path.exists(IHME_LOCATIONS_CSV):
+        raise ValueError(f"{path} is an IHME export, which is matched to countries by location_id: "
+                         f"vendor IHME's location table first with `python preprocess.py ihme-locations FILE`")
+    causes = ', '.join(f"('{ihme}', '{ours}')" for ihme, ours in IHME_CAUSES.items())
+    con.execute(f"""
+        CREATE TABLE burden AS
+        SELECT e.location_name AS location, l."alpha-3" AS alpha3, e.year::SMALLINT AS year,
+               coalesce(m.cause, e.cause_name) AS cause, e.sex_name AS sex, e.age_name AS age, e.val::DOUBLE AS value
+        FROM read_csv(?) AS e
+        JOIN read_csv(?, all_varchar = true) AS l ON l.location_id::INTEGER = e.location_id
+        LEFT JOIN (VALUES {causes}) AS m(ihme, cause) ON m.ihme = e.cause_name
+        WHERE e.measure_name = ? AND e.metric_name = ?
+        ORDER BY cause, year, location
+    """, [path, IHME_LOCATIONS_CSV, IHME_MEASURE, IHME_METRIC])
+    if not con.execute("SELECT count(*) FROM burden").fetchone()[0]:
+        raise ValueError(f"{path} has no {IHME_MEASURE} {IHME_METRIC} rows for any country")
+
+
+def populate(con, path=BURDEN_CSV):
+    """Create the countries and burden tables from the GBD extract at `path` in `con`."""
+    _create_countries(con)
+    columns = set(con.execute("SELECT * FROM read_csv(?) LIMIT 0", [path]).df().columns)
+    if 'cause_name' in columns:
+        missing = [column for column in IHME_COLUMNS if column not in columns]
+        if missing:
+            raise ValueError(f"IHME export {path} lacks the {', '.join(missing)} column(s) "
+                             f"(location_id is included when exporting with IDs)")
+        _create_burden_from_ihme(con, path)
+    elif set(BURDEN_COLUMNS) <= columns:
+        _create_burden_from_owid(con, path)
+    else:
+        raise ValueError(f"{path} is neither an IHME GBD Results export nor an Our World in Data extract like "
+                         f"{os.path.basename(BURDEN_CSV)}")
+    con.execute("CREATE INDEX burden_alpha3 ON burden (alpha3)")
+    con.execute("CREATE TABLE meta AS SELECT ? AS source, ? AS countries",
+                [json.dumps(_source(path)), json.dumps(_source(COUNTRY_CODES_CSV))])
+
+
+def _source(path):
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return {'path': os.path.abspath(path), 'version': file_version(path), 'sha256': digest}
+
+
+def build_query_db(path=BURDEN_CSV):
+    """Write the query database for the GBD extract at `path`; returns its path."""
+    os.makedirs(store.STORE_DIR, exist_ok=True)
+    tmp = QUERY_DB + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    con = duckdb.connect()
+    try:
+        # ATTACH takes no bound parameters
+        target = tmp.replace("'", "''")
+        con.execute(f"ATTACH '{target}' AS target (ROW_GROUP_SIZE {ROW_GROUP_SIZE})")
+        con.execute("USE target")
+        populate(con, path)
+        con.execute("USE memory")
+        con.execute("DETACH target")
+    finally:
+        con.close()
+    # Write then rename, so a reader never opens a half-written database
+    os.replace(tmp, QUERY_DB)
+    return QUERY_DB
+
+
+##### Runtime connection ########
+def _query_db_version():
+    try:
+        return file_version(QUERY_DB)
+    except FileNotFoundError:
+        return None
+
+
+def version():
+    """Changes whenever the query database, or the bundled files it falls back to, is replaced."""
+    return _query_db_version(), file_version(BURDEN_CSV), file_version(COUNTRY_CODES_CSV)
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _connection(db_version, burden_version, codes_version):
+    if db_version is not None:
+        con = duckdb.connect(QUERY_DB, read_only=True)
+        row = con.execute("SELECT * FROM meta").fetchone()
+        meta = {column[0]: json.loads(value) for column, value in zip(con.description, row)}
+        # Databases written before the countries entry was recorded count as stale
+        source, countries = meta['source'], meta.get('countries', {})
+        # A database built from the bundled extract must match the current
+        # files; one built from another export is used as is, since it cannot
+        # be rebuilt here
+        if source['path'] != os.path.abspath(BURDEN_CSV):
+            if countries.get('version') != codes_version:
+                _warn_stale_countries(db_version)
+            return con
+        if source['version'] == burden_version and countries.get('version') == codes_version:
+            return con
+        con.close()
+    con = duckdb.connect()
+    populate(con)
+    return con
+
+
+@functools.lru_cache(maxsize=None)
+def _warn_stale_countries(db_version):
+    logger.warning("%s was built with an older %s, so region filters may be out of date; rerun "
+                   "`python preprocess.py query-db` with the same export", QUERY_DB, COUNTRY_CODES_CSV)
+
+
+def cursor():
+    """A DuckDB cursor on the current query database; use one per thread and close it."""
+    con = _connection(*version())
+    return con.cursor()
+
+
+def source_digest():
+    """sha256 of the GBD extract the current query database holds."""
+    with cursor() as cur:
+        return json.loads(cur.execute("SELECT source FROM meta").fetchone()[0]).get('sha256')
+
+
+def _where(cause=None, years=None, regions=None, sub_regions=None, sexes=None, ages=None, locations=None):
+    # `years` is a single year or an inclusive (start, end) pair with either end open (None)
+    clauses, params = [], []
+    if cause is not None:
+        clauses.append("b.cause = ?")
+        params.append(cause)
+    if isinstance(years, numbers.Integral):
+        clauses.append("b.year = ?")
+        params.append(years)
+    elif years is not None:
+        start, end = years
+        if start is not None:
+            clauses.append("b.year >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("b.year <= ?")
+            params.append(end)
+    for column, values in (('c.region', regions), ('c.sub_region', sub_regions), ('b.sex', sexes),
+                           ('b.age', ages), ('b.alpha3', locations)):
+        if values:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    # An empty list is the same as leaving the filter out, so it still gets
+    # the default rather than mixing Both/Male/Female or every age group
+    if not sexes:
+        clauses.append("b.sex = ?")
+        params.append(BUNDLED_SEX)
+    if not ages:
+        clauses.append("b.age = ?")
+        params.append(BUNDLED_AGE)
+    return ' AND '.join(clauses) or 'TRUE', params
+
+
+def _query(sql, params):
+    with cursor() as cur:
+        return cur.execute(sql, params).df()
+
+
+##### Queries ########
+# Filters shared by the queries below: `years` (a year or an inclusive
+# (start, end) range), `regions` and `sub_regions` (UN M49 region and
+# sub-region names as in data/iso3166-countries.csv, e.g. 'Americas' and
+# 'Latin America and the Caribbean'; M49 intermediate regions such as
+# 'South America' are not kept),
+# `sexes` and `ages` (default: both sexes, age-standardized) and `locations`
+# (alpha-3 codes). An empty list counts as no filter.
+@timed('query')
+def burden_rows(cause, **filters):
+    """Rows of `cause` matching `filters`: location, alpha3, year, value."""
+    where, params = _where(cause, **filters)
+    return _query(f"""
+        SELECT b.location, b.alpha3, b.year, b.value
+        FROM burden AS b LEFT JOIN countries AS c USING (alpha3)
+        WHERE {where}
+        ORDER BY b.year, b.location
+    """, params)
+
+
+@timed('query')
+def top_locations(cause, n=10, **filters):
+    """The `n` locations with the highest `cause` value (mean over the matching years): location, value."""
+    where, params = _where(cause, **filters)
+    return _query(f"""
+        SELECT b.location, avg(b.value) AS value
+        FROM burden AS b LEFT JOIN countries AS c USING (alpha3)
+        WHERE {where}
+        GROUP BY b.location
+        ORDER BY value DESC, b.location
+        LIMIT ?
+    """, params + [n])
+
+
+@timed('query')
+def yearly_mean(cause, **filters):
+    """Mean `cause` value across the matching locations per year: year, value."""
+    where, params = _where(cause, **filters)
+    return _query(f"""
+        SELECT b.year, avg(b.value) AS value
+        FROM burden AS b LEFT JOIN countries AS c USING (alpha3)
+        WHERE {where}
+        GROUP BY b.year
+        ORDER BY b.year
+    """, params)
+
+
+@timed('query')
+def year_range():
+    """First and last year in the burden data."""
+    with cursor() as cur:
+        return tuple(cur.execute("SELECT min(year), max(year) FROM burden").fetchone())
+
+
+##### Chart tables ########
+@st.cache_resource(show_spinner=False, max_entries=len(DISEASES))
+def _country_series(cause, version):
+    # One row per country with its yearly values packed into a list, about a
+    # tenth of the size of the long format once inlined as JSON. Charts unpack
+    # it with transform_flatten and take a value's year from its position, so
+    # years missing between a country's first and last are packed as null.
+    rows = []
+    for (location, alpha3), group in burden_rows(cause).groupby(['location', 'alpha3'], sort=True, dropna=False):
+        series = group.set_index('year')['value']
+        series = series.reindex(range(series.index.min(), series.index.max() + 1)).round(2)
+        rows.append((location, alpha3, int(series.index[0]), [None if pd.isna(v) else float(v) for v in series]))
+    return pd.DataFrame(rows, columns=['location', 'alpha3', 'start', 'values'])
+
+
+def country_series(cause):
+    """Per-country series of `cause`: location, alpha3, first year `start`, yearly `values` (null for missing years)."""
+    return _country_series(cause, version())
+
+
+@st.cache_resource(show_spinner=False, max_entries=len(DISEASES))
+def _world_trend(cause, version):
+    return yearly_mean(cause)
+
+
+def world_trend(cause):
+    """Mean `cause` value across countries per year: year, value."""
+    return _world_trend(cause, version())
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _brfss_state_means(start, end, version):
+    with cursor() as cur:
+        # The ingested sums and counts, registered as a view without copying
+        cur.register('brfss_aggregates', brfss.load_aggregates())
+        return cur.execute("""
+            SELECT LocationID, State::VARCHAR AS State,
+                   round(sum(Depression_rate_sum) / sum(Depression_rate_count), 2) AS Depression_rate
+            FROM brfss_aggregates
+            WHERE (? IS NULL OR Year >= ?) AND (? IS NULL OR Year <= ?)
+            GROUP BY LocationID, State
+            ORDER BY LocationID
+        """, [start, start, end, end]).df()
+
+
+@timed('query')
+def brfss_state_means(years=None):
+    """Mean BRFSS depression rate per state over `years` (a year or an inclusive range): LocationID, State, Depression_rate."""
+    start, end = (years, years) if isinstance(years, numbers.Integral) else (years or (None, None))
+    return _brfss_state_means(start, end, brfss.aggregates_version())
@@ -0,0 +1,115 @@
+import collections
+import concurrent.futures
+import json
+import logging
+import threading
+
+import altair as alt
+
+from instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# st.altair_chart serializes with Altair's "none" theme so Streamlit's own
+# theme applies; do the same so cached specs render identically. The theme is
+# process-wide and every chart is serialized here, so it is enabled once
+# rather than switched per call, which would race between sessions.
+alt.theme.enable("none")
+
+
+@timed('serialize')
+def chart_to_spec(chart, datasets=None):
+    """Serialize `chart`, adding `datasets` for any alt.NamedData it references."""
+    spec = chart.to_dict()
+    if datasets:
+        # TopoJSON payloads ride in spec["datasets"]; Streamlit before 1.65
+        # pushes every entry through Arrow, hence the floor in requirements.txt
+        spec.setdefault("datasets", {}).update(datasets)
+    return spec
+
+
+class SpecCache:
+    """Thread-safe LRU of built Vega-Lite spec dicts, bounded by their serialized size.
+
+    Keys should include every chart parameter plus the dataset version, so a
+    data refresh naturally misses and the stale entries age out. Cached specs
+    are shared between sessions and must not be mutated.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @timed('spec_cache')
+    def get(self, key, build):
+        """Return the spec for `key`, calling `build()` and caching its result on a miss.
+
+        Concurrent misses on the same key wait for the first caller's build
+        instead of building it again.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            pending = self._building.get(key)
+            if pending is None:
+                pending = self._building[key] = concurrent.futures.Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+
+        # Build outside the lock so other keys are not held up
+        try:
+            spec = build()
+            self.put(key, spec)
+            pending.set_result(spec)
+            return spec
+        except BaseException as error:
+            pending.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._building[key]
+
+    def put(self, key, spec):
+        size = len(json.dumps(spec, separators=(",", ":")))
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (spec, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+
+def warm_up(cache, builders):
+    """Call each of `builders` (functions that fetch a spec through `cache`) on a daemon thread."""
+    def run():
+        for build in builders:
+            try:
+                build()
+            except Exception:
+                logger.exception("Spec cache warm-up failed for %r", build)
+        logger.info("Spec cache warm-up done: %d specs, %d bytes", len(cache), cache.total_bytes)
+
+    thread = threading.Thread(target=run, name="spec-cache-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,101 @@
+import json
+import math
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from instrumentation import timed
+
+# Columnar copies of the source CSVs, written by `python preprocess.py store`.
+# Tables are uncompressed Arrow IPC (Feather v2) files so readers can
+# memory-map them and materialize only the projected columns.
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "store")
+# Largest number of significant digits a float32 holds exactly
+FLOAT32_DIGITS = 7
+
+
+def table_path(name):
+    return os.path.join(STORE_DIR, f"{name}.arrow")
+
+
+def _decimals(values):
+    # Smallest rounding that reproduces the source values, capped at what
+    # float32 can carry for the column's magnitude.
+    values = values.dropna().to_numpy(dtype='float64')
+    if len(values) == 0:
+        return 0
+    magnitude = max(1, math.ceil(math.log10(np.abs(values).max() + 1)))
+    cap = max(0, FLOAT32_DIGITS - magnitude)
+    for decimals in range(cap):
+        if np.allclose(np.round(values, decimals), values, rtol=0, atol=10.0 ** -(decimals + 6)):
+            return decimals
+    return cap
+
+
+def write_table(name, frame, source_version, dtypes):
+    """Write `frame` cast to `dtypes` (which also selects the stored columns) as table `name`.
+
+    `source_version` is any JSON value identifying what the table was built from.
+    """
+    decimals = {col: _decimals(frame[col]) for col, dtype in dtypes.items() if dtype == 'float32'}
+    frame = frame[list(dtypes)].astype(dtypes)
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'store'] = json.dumps({'source_version': source_version, 'decimals': decimals}).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    path = table_path(name)
+    # Write then rename, so a reader never maps a half-written file
+    feather.write_feather(table, path + '.tmp', compression='uncompressed')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+@timed('read_store')
+def read_table(name, source_version, columns=None):
+    """Memory-map table `name` and return `columns` as a read-only DataFrame.
+
+    Returns None when the table was not built or was built from a different
+    version of its source, so callers can fall back to parsing the CSV. Pass
+    `source_version=None` to accept whatever version was stored.
+    """
+    path = table_path(name)
+    if not os.path.exists(path):
+        return None
+    table = feather.read_table(path, columns=list(columns) if columns else None, memory_map=True)
+    store = json.loads(table.schema.metadata[b'store'])
+    if source_version is not None and store['source_version'] != source_version:
+        return None
+
+    # One block per column, so numeric columns stay views of the mapped file
+    # instead of being copied into a consolidated block
+    frame = table.to_pandas(split_blocks=True)
+    frame.attrs['decimals'] = {col: decimals for col, decimals in store['decimals'].items() if col in frame}
+    return frame
+
+
+def source_precision(frame):
+    """`frame` with its float32 metrics as float64 rounded to their source precision.
+
+    For values headed into a chart spec, where float32 would show noise
+    digits; the rest of the app works on the stored float32 columns.
+    """
+    decimals = frame.attrs.get('decimals')
+    if not decimals:
+        return frame
+    return frame.astype({col: 'float64' for col in decimals}).round(decimals)
+
+
+def read_source_version(name):
+    """The `source_version` table `name` was written with, or None if it was not built."""
+    path = table_path(name)
+    if not os.path.exists(path):
+        return None
+    with pa.memory_map(path) as source:
+        schema = pa.ipc.open_file(source).schema
+    return json.loads(schema.metadata[b'store'])['source_version']